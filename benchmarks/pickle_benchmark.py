@@ -0,0 +1,95 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare the compact pickling of messages with default __dict__ pickling.
+
+Usage:
+    PYTHONPATH=. python benchmarks/pickle_benchmark.py [message count]
+"""
+
+import contextlib
+import pickle
+import sys
+import timeit
+from chatbase import *
+
+PATCHED = (Message, MessageSet, FacebookUserMessageSet,
+           FacebookAgentMessageSet)
+# Classes whose __setstate__, kept for loading old pickles, would slow the
+# default pickling down
+LEGACY_STATE = (FacebookUserMessage, FacebookAgentMessage, MessageSet,
+                FacebookUserMessageSet, FacebookAgentMessageSet)
+
+
+@contextlib.contextmanager
+def default_pickling():
+    """Temporarily fall back to pickling instance __dict__s."""
+    saved = [cls.__dict__['__reduce__'] for cls in PATCHED]
+    saved_setstate = [cls.__dict__['__setstate__'] for cls in LEGACY_STATE]
+    for cls in PATCHED:
+        cls.__reduce__ = object.__reduce__
+    for cls in LEGACY_STATE:
+        del cls.__setstate__
+    try:
+        yield
+    finally:
+        for cls, reduce_method in zip(PATCHED, saved):
+            cls.__reduce__ = reduce_method
+        for cls, setstate in zip(LEGACY_STATE, saved_setstate):
+            cls.__setstate__ = setstate
+
+
+def build_sets(count):
+    msg_set = MessageSet(api_key='key', platform='kik', version='1.0',
+                         user_id='user')
+    user_set = FacebookUserMessageSet(api_key='key', version='1.0')
+    agent_set = FacebookAgentMessageSet(api_key='key', version='1.0')
+    for i in range(count):
+        msg_set.new_message(intent='greet', message='hello %d' % i)
+        msg = user_set.new_message(intent='greet', message='hello %d' % i)
+        msg.set_sender_id('sender-%d' % (i % 100))
+        msg.set_recipient_id('page')
+        msg.set_message_id('mid.%d' % i)
+        msg = agent_set.new_message(intent='greet', message='hi %d' % i)
+        msg.set_recipient_id('sender-%d' % (i % 100))
+        msg.set_message_id('mid.%d' % i)
+    return msg_set, user_set, agent_set
+
+
+def measure(obj, repeat=5):
+    """Return (payload bytes, best round trip seconds)."""
+    protocol = pickle.HIGHEST_PROTOCOL
+    size = len(pickle.dumps(obj, protocol))
+    best = min(timeit.repeat(
+        lambda: pickle.loads(pickle.dumps(obj, protocol)),
+        number=1, repeat=repeat))
+    return size, best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print('%-24s %12s %12s %10s %10s' % ('set (%d msgs)' % count,
+                                         'default B', 'compact B',
+                                         'default s', 'compact s'))
+    for s in build_sets(count):
+        with default_pickling():
+            default_size, default_time = measure(s)
+        compact_size, compact_time = measure(s)
+        print('%-24s %12d %12d %10.4f %10.4f' % (
+            type(s).__name__, default_size, compact_size, default_time,
+            compact_time))
+
+
+if __name__ == '__main__':
+    main()
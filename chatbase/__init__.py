@@ -14,7 +14,17 @@
 
 """Init handles module initialization."""
 
+from chatbase.adaptive import *
 from chatbase.base_message import *
+from chatbase.batch_result import *
 from chatbase.facebook_agent_message import *
 from chatbase.facebook_chatbase_fields import *
 from chatbase.facebook_user_message import *
+from chatbase.ordered_dispatch import *
+from chatbase.parallel_encoding import *
+from chatbase.sampling import *
+from chatbase.spilling_message_set import *
+from chatbase.batch_sender import *
+from chatbase.capture import *
+from chatbase.transport import *
+from chatbase.validation import *
@@ -0,0 +1,150 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tune batch size and concurrency of batch sends from observed latency."""
+
+import threading
+import time
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+from .batch_result import (BatchResult, MessageResult, MessageStatus,
+                           copy_with_messages)
+
+
+class AdaptiveController(object):
+    """Additive-increase/multiplicative-decrease controller.
+    Every batch that succeeds within target_latency grows the batch size by
+    batch_step, and every concurrency such batches in a row add one request
+    in flight. A failed or slow batch multiplies both by decrease_factor.
+    Only batches started after the last decrease can trigger another one,
+    so one burst of slow responses is not punished several times. Both
+    values stay within their configured bounds.
+    """
+
+    def __init__(self,
+                 min_batch_size=10,
+                 max_batch_size=1000,
+                 min_concurrency=1,
+                 max_concurrency=16,
+                 target_latency=1.0,
+                 batch_step=None,
+                 decrease_factor=0.5):
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.batch_step = batch_step or min_batch_size
+        self.decrease_factor = decrease_factor
+        self.batch_size = min_batch_size
+        self.concurrency = min_concurrency
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, started_at, latency, succeeded):
+        """Adjust the limits after a batch started at started_at completed."""
+        with self._lock:
+            if succeeded and latency <= self.target_latency:
+                self.batch_size = min(self.max_batch_size,
+                                      self.batch_size + self.batch_step)
+                self._successes += 1
+                if self._successes >= self.concurrency:
+                    self.concurrency = min(self.max_concurrency,
+                                           self.concurrency + 1)
+                    self._successes = 0
+            elif started_at >= self._last_decrease:
+                self.batch_size = max(
+                    self.min_batch_size,
+                    int(self.batch_size * self.decrease_factor))
+                self.concurrency = max(
+                    self.min_concurrency,
+                    int(self.concurrency * self.decrease_factor))
+                self._successes = 0
+                self._last_decrease = time.time()
+
+
+def send_adaptive(message_set, controller=None, transport=None):
+    """Send the messages of a set in batches sized by controller.
+    Batches are sent by a pool of controller.max_concurrency threads, with
+    up to controller.concurrency of them in flight at a time; both limits
+    are re-read before each batch is dispatched. A batch counts as failed
+    when the request fails or the API rejects any of its messages. Pass
+    the same controller to later calls to keep what it learned. Returns
+    the BatchResult of every batch, in message order. Sets with messages
+    spilled to disk are rejected; send them with send() or
+    send_with_results() instead.
+    """
+    if getattr(message_set, 'spilled_count', 0):
+        raise ValueError('send_adaptive cannot send spilled messages')
+    if controller is None:
+        controller = AdaptiveController()
+    messages = message_set.messages_to_send()
+    results = []
+    cond = threading.Condition()
+    in_flight = [0]
+
+    def send_batch(index, batch):
+        started_at = time.time()
+        try:
+            result = copy_with_messages(message_set, batch).send_with_results(
+                transport)
+            succeeded = (result.response.status_code < 400 and
+                         result.all_succeeded)
+        except Exception as exc:  # pylint: disable=broad-except
+            result = BatchResult(None, [
+                MessageResult(m, MessageStatus.ERROR, error=str(exc))
+                for m in batch])
+            succeeded = False
+        controller.record(started_at, time.time() - started_at, succeeded)
+        with cond:
+            results[index] = result
+            in_flight[0] -= 1
+            cond.notify_all()
+
+    def work():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            send_batch(*item)
+
+    pending = queue.Queue()
+    workers = [threading.Thread(target=work)
+               for _ in range(max(1, controller.max_concurrency))]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    try:
+        offset = 0
+        while offset < len(messages):
+            with cond:
+                while in_flight[0] >= controller.concurrency:
+                    cond.wait()
+                in_flight[0] += 1
+                batch = messages[offset:offset + controller.batch_size]
+                offset += len(batch)
+                results.append(None)
+            pending.put((len(results) - 1, batch))
+        with cond:
+            while in_flight[0]:
+                cond.wait()
+    finally:
+        for _ in workers:
+            pending.put(None)
+    return results
@@ -14,8 +14,12 @@
 
 """Define the core attributes/methods on a Message instance."""
 import json
-import requests
+import operator
 import time
+from .batch_result import send_with_results, retry_failed
+from .pickling import pack_messages, reduce_state, unpack_messages
+from .transport import get_transport
+from .validation import Rule, drop_invalid, required, validate_messages
 
 
 class InvalidMessageTypeError(Exception):
@@ -42,6 +46,21 @@ class Message(object):
     Define attributes present on all variants of the Message Class.
     """
 
+    # Checks run by validate_messages() before a set is encoded
+    validation_rules = (
+        required('user_id'),
+        required('platform'),
+        Rule('type',
+             lambda m: m.type in (MessageTypes.USER, MessageTypes.AGENT),
+             'must be user or agent'),
+        Rule('not_handled',
+             lambda m: not (m.not_handled and m.type == MessageTypes.AGENT),
+             'cannot be True when msg is of type Agent'),
+        Rule('feedback',
+             lambda m: not (m.feedback and m.type == MessageTypes.AGENT),
+             'cannot be True when msg is of type Agent'),
+    )
+
     def __init__(self,
                  api_key="",
                  platform="",
@@ -63,6 +82,26 @@ class Message(object):
         self.time_stamp = time_stamp or Message.get_current_timestamp()
         self.type = type or MessageTypes.USER
 
+    # Attributes pickled, in order, by __reduce__
+    _fields = ('api_key', 'platform', 'message', 'intent', 'version',
+               'user_id', 'not_handled', 'feedback', 'time_stamp', 'type')
+    _get_fields = operator.itemgetter(*_fields)
+
+    def __reduce__(self):
+        return reduce_state(self, self._fields)
+
+    def _get_state(self):
+        """Return the flat tuple of values pickled for this message."""
+        return self._get_fields(self.__dict__)
+
+    def _set_state(self, state):
+        """Restore the values returned by _get_state."""
+        self.__dict__.update(zip(self._fields, state))
+
+    def get_user_key(self):
+        """Return the id of the user this message belongs to."""
+        return self.user_id
+
     @staticmethod
     def get_current_timestamp():
         """Returns the current epoch with MS precision."""
@@ -113,12 +152,19 @@ class Message(object):
         """Return a JSON version for use with the Chatbase API"""
         return json.dumps(self, default=lambda i: i.__dict__)
 
-    def send(self):
+    def to_set_format(self):
+        """Return a dictionary version of the message for a set"""
+        return self.__dict__
+
+    def get_url(self):
+        """Return the Chatbase API endpoint for this message."""
+        return "https://chatbase.com/api/message"
+
+    def send(self, transport=None):
         """Send the message to the Chatbase API."""
-        url = "https://chatbase.com/api/message"
-        return requests.post(url,
-                             data=self.to_json(),
-                             headers=Message.get_content_type())
+        return get_transport(transport).post(self.get_url(),
+                                             data=self.to_json(),
+                                             headers=Message.get_content_type())
 
 
 class MessageSet(object):
@@ -130,15 +176,51 @@ class MessageSet(object):
                  api_key="",
                  platform="",
                  version="",
-                 user_id=""):
+                 user_id="",
+                 sampler=None,
+                 validate_on_send=False):
         self.api_key = api_key
         self.platform = platform
         self.version = version
         self.user_id = user_id
+        self.sampler = sampler
+        self.validate_on_send = validate_on_send
+        self.validation_errors = []
         self.messages = []
 
+    _fields = ('api_key', 'platform', 'version', 'user_id', 'sampler',
+               'validate_on_send', 'validation_errors', 'messages')
+    _get_fields = operator.itemgetter(*_fields)
+
+    def __reduce__(self):
+        return reduce_state(self, self._fields)
+
+    def _get_state(self):
+        """Return the flat tuple of values pickled for this set."""
+        state = MessageSet._get_fields(self.__dict__)
+        return state[:-1] + (pack_messages(state[-1]),)
+
+    def _set_state(self, state):
+        """Restore the values returned by _get_state."""
+        self.__dict__.update(zip(MessageSet._fields, state))
+        self.messages = unpack_messages(self.messages)
+
+    def __setstate__(self, state):
+        """Restore a set pickled by releases without the sampler and
+        validation options, which are given their defaults.
+        """
+        self.__init__()
+        self.__dict__.update(state)
+
     def append_message(self, message_object):
-        """Append a Message object to the set."""
+        """Append a Message object to the set.
+        Messages of users sampled out by the set's sampler are dropped.
+        """
+        if self.sampler is None or self.sampler.keep_message(message_object):
+            self._add_message(message_object)
+
+    def _add_message(self, message_object):
+        """Append a Message object the sampler has already kept."""
         self.messages.append(message_object)
 
     def new_message(self,
@@ -147,26 +229,65 @@ class MessageSet(object):
                     type=None,
                     not_handled=False,
                     time_stamp=None):
-        """Add a message to the internal messages list and return it"""
-        self.messages.append(Message(api_key=self.api_key,
-                                     platform=self.platform,
-                                     version=self.version,
-                                     user_id=self.user_id,
-                                     intent=intent,
-                                     message=message,
-                                     type=type,
-                                     not_handled=not_handled,
-                                     time_stamp=time_stamp))
-        return self.messages[-1]
+        """Add a message to the internal messages list and return it.
+        Returns None, without building the message, when the set's user is
+        sampled out for intent.
+        """
+        if self.sampler is not None and not self.sampler.keep(self.user_id,
+                                                              intent):
+            return None
+        msg = Message(api_key=self.api_key,
+                      platform=self.platform,
+                      version=self.version,
+                      user_id=self.user_id,
+                      intent=intent,
+                      message=message,
+                      type=type,
+                      not_handled=not_handled,
+                      time_stamp=time_stamp)
+        # keep() has decided for the set's user already
+        self._add_message(msg)
+        return msg
 
     def to_json(self):
         """Return a JSON version for use with the Chatbase API"""
-        return json.dumps({'messages': self.messages},
-                          default=lambda i: i.__dict__)
+        msgs = [msg.to_set_format() for msg in self.messages_to_send()]
+        return json.dumps({'messages': msgs}, default=lambda i: i.__dict__)
+
+    def messages_to_send(self):
+        """Return the messages kept by the set's sampler and, when the set
+        validates on send, by their validation_rules. The FieldErrors of
+        the messages dropped are kept in validation_errors.
+        """
+        messages = self.messages
+        if self.sampler is not None:
+            messages = self.sampler.filter(messages)
+        if self.validate_on_send:
+            messages, self.validation_errors = validate_messages(messages)
+        return messages
+
+    def get_url(self):
+        """Return the Chatbase API endpoint for this message set."""
+        return ("https://chatbase.com/api/messages?api_key=%s" % self.api_key)
 
-    def send(self):
+    def send(self, transport=None):
         """Send the message set to the Chatbase API"""
-        url = ("https://chatbase.com/api/messages?api_key=%s" % self.api_key)
-        return requests.post(url,
-                             data=self.to_json(),
-                             headers=Message.get_content_type())
+        return get_transport(transport).post(self.get_url(),
+                                             data=self.to_json(),
+                                             headers=Message.get_content_type())
+
+    def send_with_results(self, transport=None):
+        """Send the message set and return its per-message BatchResult."""
+        return send_with_results(self, transport)
+
+    def retry_failed(self, result, transport=None):
+        """Resend only the messages that failed in a previous BatchResult."""
+        return retry_failed(self, result, transport)
+
+    def validate(self):
+        """Return a FieldError for every rule the messages of the set break."""
+        return validate_messages(self.messages)[1]
+
+    def drop_invalid(self):
+        """Remove invalid messages from the set and return their FieldErrors."""
+        return drop_invalid(self)
@@ -0,0 +1,115 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Map batch API responses back onto the messages that were sent."""
+
+import copy
+
+
+class MessageStatus(object):
+    """Defines per-message statuses returned by the batch APIs."""
+    SUCCESS = "success"
+    ERROR = "error"
+
+
+class MessageResult(object):
+    """Outcome of a single message within a batch request."""
+
+    def __init__(self, message, status, message_id=None, error=None):
+        self.message = message
+        self.status = status
+        self.message_id = message_id
+        self.error = error
+
+    @property
+    def succeeded(self):
+        """True when the API accepted the message."""
+        return self.status == MessageStatus.SUCCESS
+
+
+class BatchResult(object):
+    """Per-message outcome of a batch request."""
+
+    def __init__(self, response, results):
+        self.response = response
+        self.results = results
+
+    @property
+    def all_succeeded(self):
+        """True when every message in the batch was accepted."""
+        return all(r.succeeded for r in self.results)
+
+    @property
+    def failed(self):
+        """Return the results of the rejected messages."""
+        return [r for r in self.results if not r.succeeded]
+
+    def failed_messages(self):
+        """Return the Message instances that were rejected.
+        Rejected messages without an instance, such as the spilled messages
+        of a SpillingMessageSet, are left out.
+        """
+        return [r.message for r in self.failed if r.message is not None]
+
+    @classmethod
+    def from_response(cls, response, messages):
+        """Parse a batch response into a BatchResult.
+        The batch APIs answer with a 'responses' list in the same order as the
+        submitted messages. When the body carries no such list every message
+        is given the outcome of the HTTP request as a whole.
+        """
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        entries = body.get('responses') if isinstance(body, dict) else None
+        if not isinstance(entries, list) or len(entries) != len(messages):
+            if response.status_code < 400:
+                status, error = MessageStatus.SUCCESS, None
+            else:
+                status, error = MessageStatus.ERROR, response.text
+            return cls(response, [MessageResult(m, status, error=error)
+                                  for m in messages])
+        results = []
+        for message, entry in zip(messages, entries):
+            results.append(MessageResult(
+                message,
+                entry.get('status', MessageStatus.ERROR),
+                message_id=entry.get('message_id'),
+                error=entry.get('error')))
+        return cls(response, results)
+
+
+def copy_with_messages(message_set, messages):
+    """Return a shallow copy of message_set holding only messages."""
+    subset = copy.copy(message_set)
+    subset.messages = list(messages)
+    return subset
+
+
+def send_with_results(message_set, transport=None):
+    """Send message_set and return its BatchResult."""
+    messages = list(message_set.messages_to_send())
+    return BatchResult.from_response(message_set.send(transport), messages)
+
+
+def retry_failed(message_set, result, transport=None):
+    """Resend only the messages that failed in result.
+    Returns the BatchResult of the retry, or None if nothing failed.
+    """
+    failed = result.failed_messages()
+    if not failed:
+        return None
+    return send_with_results(copy_with_messages(message_set, failed),
+                             transport)
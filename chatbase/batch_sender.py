@@ -0,0 +1,199 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Send messages and message sets in the background with a clean shutdown."""
+
+import atexit
+import collections
+import glob
+import logging
+import os
+import pickle
+import signal
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SPILL_FILE_PREFIX = "chatbase-spill-"
+SPILL_FILE_SUFFIX = ".pkl"
+
+
+class BatchSender(object):
+    """Batch Sender.
+    Queue anything with a send() method (Message, MessageSet and the Facebook
+    variants) and send it from a pool of background worker threads.
+
+    flush() waits for the pending sends within a hard deadline; whatever is
+    still queued, in flight or failed when the deadline passes is pickled to
+    spill_dir so it can be re-queued with load_spilled() after a restart.
+    Items spilled while in flight may also reach the API, so delivery of
+    spilled items is at-least-once.
+    """
+
+    def __init__(self,
+                 workers=4,
+                 spill_dir=None,
+                 shutdown_timeout=5.0,
+                 register_atexit=True,
+                 transport=None):
+        self.spill_dir = spill_dir
+        self.transport = transport
+        self.shutdown_timeout = shutdown_timeout
+        self._cond = threading.Condition()
+        self._queue = collections.deque()
+        self._in_flight = {}
+        self._failed = []
+        self._next_id = 0
+        self._closed = False
+        self._threads = []
+        for _ in range(max(1, workers)):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        self._atexit_registered = register_atexit
+        if register_atexit:
+            atexit.register(self.close)
+
+    def send(self, item):
+        """Queue an item for sending in the background."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('Cannot send on a closed BatchSender')
+            self._queue.append(item)
+            self._cond.notify_all()
+
+    def pending_count(self):
+        """Return the number of queued, in flight and failed items."""
+        with self._cond:
+            return len(self._queue) + len(self._in_flight) + len(self._failed)
+
+    def _work(self):
+        """Worker loop: send queued items until the sender is closed."""
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                item = self._queue.popleft()
+                item_id = self._next_id
+                self._next_id += 1
+                self._in_flight[item_id] = item
+            failed = False
+            try:
+                resp = item.send(self.transport)
+                status_code = getattr(resp, 'status_code', None)
+                failed = status_code is None or status_code >= 400
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Sending %r failed', item)
+                failed = True
+            with self._cond:
+                # flush() drops in flight items it has already spilled
+                if self._in_flight.pop(item_id, None) is not None and failed:
+                    self._failed.append(item)
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait up to timeout seconds for all pending items to be sent.
+        Items that could not be sent in time, or whose send failed, are
+        spilled to disk (or dropped with a warning when no spill_dir is set).
+        Returns True when everything was sent.
+        """
+        if timeout is None:
+            timeout = self.shutdown_timeout
+        deadline = time.time() + timeout
+        with self._cond:
+            while self._queue or self._in_flight:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            leftover = (self._failed + list(self._in_flight.values()) +
+                        list(self._queue))
+            self._failed = []
+            self._in_flight.clear()
+            self._queue.clear()
+        if leftover:
+            self._spill(leftover)
+        return not leftover
+
+    def close(self, timeout=None):
+        """Flush pending items and stop the worker threads."""
+        with self._cond:
+            if self._closed:
+                return True
+        drained = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._atexit_registered and hasattr(atexit, 'unregister'):
+            atexit.unregister(self.close)
+            self._atexit_registered = False
+        return drained
+
+    def install_signal_handlers(self, signals=(signal.SIGTERM,)):
+        """Close the sender when one of the given signals is received.
+        The previously installed handler is called afterwards, so the default
+        behaviour (e.g. terminating on SIGTERM) is preserved. Must be called
+        from the main thread.
+        """
+        for signum in signals:
+            previous = signal.getsignal(signum)
+            signal.signal(signum, self._make_signal_handler(previous))
+
+    def _make_signal_handler(self, previous):
+        """Return a handler that closes the sender and chains to previous."""
+        def handler(signum, frame):
+            self.close()
+            if callable(previous):
+                previous(signum, frame)
+            elif previous != signal.SIG_IGN:
+                signal.signal(signum, signal.SIG_DFL)
+                os.kill(os.getpid(), signum)
+        return handler
+
+    def _spill(self, items):
+        """Write items to a new spill file in spill_dir."""
+        if self.spill_dir is None:
+            logger.warning('Dropping %d unsent items; no spill_dir set',
+                           len(items))
+            return None
+        fd, tmp_path = tempfile.mkstemp(dir=self.spill_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as spill_file:
+            pickle.dump(items, spill_file, pickle.HIGHEST_PROTOCOL)
+        path = os.path.join(self.spill_dir, '%s%d-%d%s' % (
+            SPILL_FILE_PREFIX, os.getpid(), int(time.time() * 1e6),
+            SPILL_FILE_SUFFIX))
+        os.rename(tmp_path, path)
+        logger.warning('Spilled %d unsent items to %s', len(items), path)
+        return path
+
+
+def load_spilled(spill_dir, remove=True):
+    """Return the items spilled to spill_dir, oldest first.
+    When remove is True the spill files are deleted once read, so the
+    caller is expected to re-queue the returned items.
+    """
+    pattern = os.path.join(spill_dir,
+                           SPILL_FILE_PREFIX + '*' + SPILL_FILE_SUFFIX)
+    items = []
+    for path in sorted(glob.glob(pattern), key=os.path.getmtime):
+        with open(path, 'rb') as spill_file:
+            items.extend(pickle.load(spill_file))
+        if remove:
+            os.remove(path)
+    return items
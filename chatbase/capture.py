@@ -0,0 +1,127 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Record the payloads and timing of sends for later replay.
+
+A capture file is gzip compressed and holds a magic header followed by one
+record per request: a big-endian (offset seconds, url length, body length)
+header, the UTF-8 url and the encoded body exactly as it was posted.
+Captures hold the API keys of the requests, in their urls and in the
+bodies of Message sends, unless the CaptureTransport replaces them.
+"""
+
+import gzip
+import json
+import re
+import struct
+import threading
+import time
+
+try:
+    from urllib.parse import quote
+except ImportError:  # Python 2
+    from urllib import quote
+
+from .transport import Transport, TransportResponse, get_default_transport
+
+CAPTURE_MAGIC = b"CBCAP1\n"
+_RECORD_HEADER = struct.Struct(">dHI")
+_URL_API_KEY = re.compile(r'([?&]api_key=)[^&#]*')
+_BODY_API_KEY = re.compile(br'("api_key"\s*:\s*)"(?:[^"\\]|\\.)*"')
+
+
+def replace_api_key(url, data, api_key):
+    """Return url and the bytes body data with every api_key set to api_key.
+    The rest of the url and body are kept byte for byte.
+    """
+    url = _URL_API_KEY.sub(lambda m: m.group(1) + quote(api_key, safe=''),
+                           url)
+    value = json.dumps(api_key).encode('utf-8')
+    data = _BODY_API_KEY.sub(lambda m: m.group(1) + value, data)
+    return url, data
+
+
+class CapturedRequest(object):
+    """A request read back from a capture file."""
+
+    def __init__(self, offset, url, data):
+        self.offset = offset
+        self.url = url
+        self.data = data
+
+
+class CaptureTransport(Transport):
+    """Transport that records every post to a capture file.
+    Posts are forwarded to transport (the default transport at construction
+    time when None) unless forward is False, in which case a 200 response is
+    returned. The capture can then be installed as the default transport.
+    When api_key is not None, it replaces the API key of every recorded
+    request (e.g. "" to strip it); forwarded requests keep their key.
+    """
+
+    def __init__(self, path, transport=None, forward=True, api_key=None):
+        self.transport = transport or get_default_transport()
+        self.path = path
+        self.forward = forward
+        self.api_key = api_key
+        self._file = gzip.open(path, 'wb')
+        self._file.write(CAPTURE_MAGIC)
+        self._lock = threading.Lock()
+        self._start = time.time()
+
+    @property
+    def transport(self):
+        """The transport posts are forwarded to."""
+        return self._transport
+
+    @transport.setter
+    def transport(self, transport):
+        if transport is self:
+            raise ValueError('CaptureTransport cannot forward to itself')
+        self._transport = transport
+
+    def post(self, url, data, headers):
+        """Record the request, then forward it."""
+        body = data if isinstance(data, bytes) else data.encode('utf-8')
+        recorded_url = url
+        if self.api_key is not None:
+            recorded_url, body = replace_api_key(url, body, self.api_key)
+        url_bytes = recorded_url.encode('utf-8')
+        with self._lock:
+            self._file.write(_RECORD_HEADER.pack(time.time() - self._start,
+                                                 len(url_bytes), len(body)))
+            self._file.write(url_bytes)
+            self._file.write(body)
+        if not self.forward:
+            return TransportResponse()
+        return self.transport.post(url, data, headers)
+
+    def close(self):
+        """Finish writing the capture file."""
+        with self._lock:
+            self._file.close()
+
+
+def read_capture(path):
+    """Yield the CapturedRequests stored in a capture file, in order."""
+    with gzip.open(path, 'rb') as capture_file:
+        if capture_file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError('%s is not a Chatbase capture file' % path)
+        while True:
+            header = capture_file.read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                return
+            offset, url_len, body_len = _RECORD_HEADER.unpack(header)
+            url = capture_file.read(url_len).decode('utf-8')
+            yield CapturedRequest(offset, url, capture_file.read(body_len))
@@ -15,8 +15,12 @@
 """Define the attributes on facebook agent messages."""
 
 import json
-import requests
+import operator
 from .base_message import Message
+from .batch_result import send_with_results, retry_failed
+from .pickling import pack_messages, reduce_state, unpack_messages
+from .transport import get_transport
+from .validation import drop_invalid, required, validate_messages
 from .facebook_chatbase_fields import *
 
 
@@ -37,54 +41,236 @@ class FacebookAgentMessageResponseBody(object):
         self.message_id = ''
 
 
+class FacebookAgentMessageRequestBodyView(FacebookAgentMessageRequestBody):
+    """Request body reading and writing fields stored flat on a message."""
+    __slots__ = ('_owner',)
+
+    def __init__(self, owner):
+        self._owner = owner
+
+    timestamp = fixed_property('_request_timestamp')
+
+    @property
+    def recipient(self):
+        """The recipient's FacebookID."""
+        facebook_id = assigned_object(self._owner, 'request_body.recipient')
+        if facebook_id is None:
+            return FacebookIDView(self._owner, '_recipient_id')
+        return facebook_id
+
+    @recipient.setter
+    def recipient(self, facebook_id):
+        assign_object(self._owner, 'request_body.recipient', facebook_id)
+
+    @property
+    def message(self):
+        """The FacebookUserMessageContent of the message."""
+        content = assigned_object(self._owner, 'request_body.message')
+        if content is None:
+            return FacebookUserMessageContentView(self._owner, '_message_id')
+        return content
+
+    @message.setter
+    def message(self, content):
+        assign_object(self._owner, 'request_body.message', content)
+
+    @property
+    def __dict__(self):
+        return {'recipient': self.recipient, 'message': self.message,
+                'timestamp': self.timestamp}
+
+
+class FacebookAgentMessageResponseBodyView(FacebookAgentMessageResponseBody):
+    """Response body reading and writing fields stored flat on a message."""
+    __slots__ = ('_owner',)
+
+    def __init__(self, owner):
+        self._owner = owner
+
+    recipient_id = fixed_property('_response_recipient_id')
+    message_id = fixed_property('_response_message_id')
+
+    @property
+    def __dict__(self):
+        return {'recipient_id': self.recipient_id,
+                'message_id': self.message_id}
+
+
 class FacebookAgentMessage(Message):
     """FacebookAgentMessage represents a message
     garnered from an agent via facebook.
     """
 
+    validation_rules = (
+        required('request_body.recipient.id', '_recipient_id'),
+        required('request_body.message.mid', '_message_id'),
+    )
+
     def __init__(self, api_key="", intent="", version="", message=""):
         super(FacebookAgentMessage, self).__init__(api_key=api_key,
                                                    intent=intent,
                                                    version=version,
                                                    message=message)
-        self.request_body = FacebookAgentMessageRequestBody()
-        self.response_body = FacebookAgentMessageResponseBody()
-        self.chatbase_fields = ChatbaseFields()
+        # The nested request_body, response_body and chatbase_fields
+        # objects are views built on access over these flat fields, until
+        # an object is assigned to one of them (see assign_object)
+        self._recipient_id = ""
+        self._message_id = ""
+        self._request_timestamp = self.time_stamp
+        self._response_recipient_id = ""
+        self._response_message_id = ""
+
+    _fields = Message._fields + ('_recipient_id', '_message_id',
+                                 '_request_timestamp',
+                                 '_response_recipient_id',
+                                 '_response_message_id')
+    _get_fields = operator.itemgetter(*_fields)
+
+    def __setstate__(self, state):
+        """Restore a message pickled by releases that stored the nested
+        request_body, response_body and chatbase_fields objects.
+        """
+        if 'request_body' not in state:
+            self.__dict__.update(state)
+            return
+        state = dict(state)
+        request_body = state.pop('request_body')
+        response_body = state.pop('response_body')
+        state.pop('chatbase_fields', None)
+        self.__dict__.update(state)
+        self._recipient_id = request_body.recipient.id
+        self._message_id = request_body.message.mid
+        self._request_timestamp = request_body.timestamp
+        self._response_recipient_id = response_body.recipient_id
+        self._response_message_id = response_body.message_id
+
+    @property
+    def request_body(self):
+        """The FacebookAgentMessageRequestBody of the message."""
+        body = assigned_object(self, 'request_body')
+        if body is None:
+            return FacebookAgentMessageRequestBodyView(self)
+        return body
+
+    @request_body.setter
+    def request_body(self, body):
+        assign_object(self, 'request_body', body)
+
+    @property
+    def response_body(self):
+        """The FacebookAgentMessageResponseBody of the message."""
+        body = assigned_object(self, 'response_body')
+        if body is None:
+            return FacebookAgentMessageResponseBodyView(self)
+        return body
+
+    @response_body.setter
+    def response_body(self, body):
+        assign_object(self, 'response_body', body)
+
+    @property
+    def chatbase_fields(self):
+        """The ChatbaseFields of the message."""
+        fields = assigned_object(self, 'chatbase_fields')
+        if fields is None:
+            return ChatbaseFieldsView(self)
+        return fields
+
+    @chatbase_fields.setter
+    def chatbase_fields(self, fields):
+        assign_object(self, 'chatbase_fields', fields)
+
+    def get_user_key(self):
+        """Return the id of the user this message belongs to: the recipient."""
+        if '_assigned' in self.__dict__:
+            return self.request_body.recipient.id
+        return self._recipient_id
 
     def set_recipient_id(self, rec_id):
         """Set the recipient id."""
-        self.response_body.recipient_id = rec_id
-        self.request_body.recipient.id = rec_id
+        if '_assigned' in self.__dict__:
+            self.response_body.recipient_id = rec_id
+            self.request_body.recipient.id = rec_id
+        else:
+            self._response_recipient_id = rec_id
+            self._recipient_id = rec_id
 
     def set_message_id(self, msg_id):
         """Set the message id."""
-        self.response_body.message_id = msg_id
-        self.request_body.message.mid = msg_id
+        if '_assigned' in self.__dict__:
+            self.response_body.message_id = msg_id
+            self.request_body.message.mid = msg_id
+        else:
+            self._response_message_id = msg_id
+            self._message_id = msg_id
 
     def set_chatbase_fields(self):
-        """Extract chatbase fields from instance and format for transmission."""
+        """Extract chatbase fields from instance and format for transmission.
+        Only assigned objects need the copy; the views read the instance.
+        """
+        if '_assigned' not in self.__dict__:
+            return
         self.chatbase_fields.intent = self.intent
         self.chatbase_fields.version = self.version
         self.chatbase_fields.not_handled = self.not_handled
         self.chatbase_fields.feedback = self.feedback
         self.request_body.message.text = self.message
 
+    def _body_format(self):
+        """Return the request/response bodies and chatbase fields as dicts."""
+        if '_assigned' in self.__dict__:
+            self.set_chatbase_fields()
+            request_body = self.request_body
+            response_body = self.response_body
+            recipient_id = request_body.recipient.id
+            message_id = request_body.message.mid
+            request_timestamp = request_body.timestamp
+            response_recipient_id = response_body.recipient_id
+            response_message_id = response_body.message_id
+        else:
+            recipient_id = self._recipient_id
+            message_id = self._message_id
+            request_timestamp = self._request_timestamp
+            response_recipient_id = self._response_recipient_id
+            response_message_id = self._response_message_id
+        return {
+            'request_body': {
+                'recipient': {'id': recipient_id},
+                'message': {'mid': message_id, 'text': self.message},
+                'timestamp': request_timestamp
+            },
+            'response_body': {
+                'recipient_id': response_recipient_id,
+                'message_id': response_message_id
+            },
+            'chatbase_fields': {
+                'intent': self.intent,
+                'version': self.version,
+                'not_handled': self.not_handled,
+                'feedback': self.feedback
+            }
+        }
+
     def to_json(self):
         """Return a JSON version for use with the Chatbase API"""
-        self.set_chatbase_fields()
-        return json.dumps({
-            'request_body': self.request_body,
-            'response_body': self.response_body,
-            'chatbase_fields': self.chatbase_fields
-        }, default=lambda i: i.__dict__)
-
-    def send(self):
-        """Send the message to the Chatbase API."""
-        url = ("https://chatbase.com/api/facebook/message_received?api_key=%s" %
+        return json.dumps(self._body_format(), default=lambda i: i.__dict__)
+
+    def to_set_format(self):
+        """Return a dictionary version of the message for a set"""
+        fmt = dict(zip(Message._fields, Message._get_fields(self.__dict__)))
+        fmt.update(self._body_format())
+        return fmt
+
+    def get_url(self):
+        """Return the Chatbase API endpoint for this message."""
+        return ("https://chatbase.com/api/facebook/message_received?api_key=%s" %
                self.api_key)
-        return requests.post(url,
-                             data=self.to_json(),
-                             headers=Message.get_content_type())
+
+    def send(self, transport=None):
+        """Send the message to the Chatbase API."""
+        return get_transport(transport).post(self.get_url(),
+                                             data=self.to_json(),
+                                             headers=Message.get_content_type())
 
 
 class FacebookAgentMessageSet(object):
@@ -94,11 +280,40 @@ class FacebookAgentMessageSet(object):
 
     def __init__(self,
                  api_key="",
-                 version=""):
+                 version="",
+                 sampler=None,
+                 validate_on_send=False):
         self.api_key = api_key
         self.version = version
+        self.sampler = sampler
+        self.validate_on_send = validate_on_send
+        self.validation_errors = []
         self.messages = []
 
+    _fields = ('api_key', 'version', 'sampler', 'validate_on_send',
+               'validation_errors', 'messages')
+    _get_fields = operator.itemgetter(*_fields)
+
+    def __reduce__(self):
+        return reduce_state(self, self._fields)
+
+    def _get_state(self):
+        """Return the flat tuple of values pickled for this set."""
+        state = self._get_fields(self.__dict__)
+        return state[:-1] + (pack_messages(state[-1]),)
+
+    def _set_state(self, state):
+        """Restore the values returned by _get_state."""
+        self.__dict__.update(zip(self._fields, state))
+        self.messages = unpack_messages(self.messages)
+
+    def __setstate__(self, state):
+        """Restore a set pickled by releases without the sampler and
+        validation options, which are given their defaults.
+        """
+        self.__init__()
+        self.__dict__.update(state)
+
     def new_message(self, intent="", message=""):
         """Add a message to the internal messages list and return it"""
         self.messages.append(FacebookAgentMessage(api_key=self.api_key,
@@ -109,14 +324,44 @@ class FacebookAgentMessageSet(object):
 
     def to_json(self):
         """Return a JSON version for use with the Chatbase API"""
-        [(lambda m: m.set_chatbase_fields())(m) for m in self.messages]
-        return json.dumps({'messages': self.messages},
-                          default=lambda i: i.__dict__)
+        msgs = [msg.to_set_format() for msg in self.messages_to_send()]
+        return json.dumps({'messages': msgs}, default=lambda i: i.__dict__)
 
-    def send(self):
-        """Send the message set to the Chatbase API"""
-        url = ("https://chatbase.com/api/facebook/send_message_batch?api_key=%s"
+    def messages_to_send(self):
+        """Return the messages kept by the set's sampler and, when the set
+        validates on send, by their validation_rules. The FieldErrors of
+        the messages dropped are kept in validation_errors.
+        """
+        messages = self.messages
+        if self.sampler is not None:
+            messages = self.sampler.filter(messages)
+        if self.validate_on_send:
+            messages, self.validation_errors = validate_messages(messages)
+        return messages
+
+    def get_url(self):
+        """Return the Chatbase API endpoint for this message set."""
+        return ("https://chatbase.com/api/facebook/send_message_batch?api_key=%s"
                % self.api_key)
-        return requests.post(url,
-                             data=self.to_json(),
-                             headers=Message.get_content_type())
+
+    def send(self, transport=None):
+        """Send the message set to the Chatbase API"""
+        return get_transport(transport).post(self.get_url(),
+                                             data=self.to_json(),
+                                             headers=Message.get_content_type())
+
+    def send_with_results(self, transport=None):
+        """Send the message set and return its per-message BatchResult."""
+        return send_with_results(self, transport)
+
+    def retry_failed(self, result, transport=None):
+        """Resend only the messages that failed in a previous BatchResult."""
+        return retry_failed(self, result, transport)
+
+    def validate(self):
+        """Return a FieldError for every rule the messages of the set break."""
+        return validate_messages(self.messages)[1]
+
+    def drop_invalid(self):
+        """Remove invalid messages from the set and return their FieldErrors."""
+        return drop_invalid(self)
@@ -38,3 +38,84 @@ class ChatbaseFields(object):
         self.version = ""
         self.not_handled = False
         self.feedback = False
+
+
+def assigned_object(owner, name):
+    """Return the object assigned to the nested attribute name of owner, or
+    None while its view over the flat fields is in use. Assigned objects
+    are kept, so later changes to them are sent, in an _assigned dict that
+    only messages assigned to carry.
+    """
+    objects = owner.__dict__.get('_assigned')
+    return objects.get(name) if objects else None
+
+
+def assign_object(owner, name, value):
+    """Assign value to the nested attribute name of owner."""
+    owner.__dict__.setdefault('_assigned', {})[name] = value
+
+
+def owner_property(attr_slot):
+    """Return a property proxying the owner attribute named by the view's
+    attr_slot slot."""
+    return property(
+        lambda self: getattr(self._owner, getattr(self, attr_slot)),
+        lambda self, value: setattr(self._owner, getattr(self, attr_slot),
+                                    value))
+
+
+def fixed_property(owner_attr):
+    """Return a property proxying the owner attribute owner_attr."""
+    return property(lambda self: getattr(self._owner, owner_attr),
+                    lambda self, value: setattr(self._owner, owner_attr, value))
+
+
+class FacebookIDView(FacebookID):
+    """FacebookID reading and writing an id stored flat on a message."""
+    __slots__ = ('_owner', '_id_attr')
+
+    def __init__(self, owner, id_attr):
+        self._owner = owner
+        self._id_attr = id_attr
+
+    id = owner_property('_id_attr')
+
+    @property
+    def __dict__(self):
+        return {'id': self.id}
+
+
+class FacebookUserMessageContentView(FacebookUserMessageContent):
+    """Message content reading and writing fields stored flat on a message.
+    The text is the message's own message attribute.
+    """
+    __slots__ = ('_owner', '_mid_attr')
+
+    def __init__(self, owner, mid_attr):
+        self._owner = owner
+        self._mid_attr = mid_attr
+
+    mid = owner_property('_mid_attr')
+    text = fixed_property('message')
+
+    @property
+    def __dict__(self):
+        return {'mid': self.mid, 'text': self.text}
+
+
+class ChatbaseFieldsView(ChatbaseFields):
+    """Chatbase fields read from, and written to, the message itself."""
+    __slots__ = ('_owner',)
+
+    def __init__(self, owner):
+        self._owner = owner
+
+    intent = fixed_property('intent')
+    version = fixed_property('version')
+    not_handled = fixed_property('not_handled')
+    feedback = fixed_property('feedback')
+
+    @property
+    def __dict__(self):
+        return {'intent': self.intent, 'version': self.version,
+                'not_handled': self.not_handled, 'feedback': self.feedback}
@@ -14,8 +14,13 @@
 
 """Define the attributes on facebook user messages."""
 
-import json, requests
+import json
+import operator
 from .base_message import Message
+from .batch_result import send_with_results, retry_failed
+from .pickling import pack_messages, reduce_state, unpack_messages
+from .transport import get_transport
+from .validation import drop_invalid, required, validate_messages
 from .facebook_chatbase_fields import *
 
 
@@ -24,31 +29,127 @@ class FacebookUserMessage(Message):
     garnered from a user via facebook.
     """
 
+    validation_rules = (
+        required('sender.id', '_sender_id'),
+        required('recipient.id', '_recipient_id'),
+        required('fb_message.mid', '_mid'),
+    )
+
     def __init__(self, api_key="", intent="", version="", message=""):
         super(FacebookUserMessage, self).__init__(api_key=api_key,
                                                   intent=intent,
                                                   version=version,
                                                   message=message)
-        self.sender = FacebookID()
-        self.recipient = FacebookID()
-        self.fb_message = FacebookUserMessageContent()
-        self.timestamp = Message.get_current_timestamp()
-        self.chatbase_fields = ChatbaseFields()
+        # The nested sender, recipient, fb_message and chatbase_fields
+        # objects are views built on access over these flat fields, until
+        # an object is assigned to one of them (see assign_object)
+        self.timestamp = self.time_stamp
+        self._sender_id = ""
+        self._recipient_id = ""
+        self._mid = ""
+
+    _fields = Message._fields + ('timestamp', '_sender_id', '_recipient_id',
+                                 '_mid')
+    _get_fields = operator.itemgetter(*_fields)
+
+    def __setstate__(self, state):
+        """Restore a message pickled by releases that stored the nested
+        sender, recipient, fb_message and chatbase_fields objects.
+        """
+        if 'sender' not in state:
+            self.__dict__.update(state)
+            return
+        state = dict(state)
+        sender = state.pop('sender')
+        recipient = state.pop('recipient')
+        content = state.pop('fb_message')
+        state.pop('chatbase_fields', None)
+        self.__dict__.update(state)
+        self._sender_id = sender.id
+        self._recipient_id = recipient.id
+        self._mid = content.mid
+
+    @property
+    def sender(self):
+        """The sender's FacebookID."""
+        facebook_id = assigned_object(self, 'sender')
+        if facebook_id is None:
+            return FacebookIDView(self, '_sender_id')
+        return facebook_id
+
+    @sender.setter
+    def sender(self, facebook_id):
+        assign_object(self, 'sender', facebook_id)
+
+    @property
+    def recipient(self):
+        """The recipient's FacebookID."""
+        facebook_id = assigned_object(self, 'recipient')
+        if facebook_id is None:
+            return FacebookIDView(self, '_recipient_id')
+        return facebook_id
+
+    @recipient.setter
+    def recipient(self, facebook_id):
+        assign_object(self, 'recipient', facebook_id)
+
+    @property
+    def fb_message(self):
+        """The FacebookUserMessageContent of the message."""
+        content = assigned_object(self, 'fb_message')
+        if content is None:
+            return FacebookUserMessageContentView(self, '_mid')
+        return content
+
+    @fb_message.setter
+    def fb_message(self, content):
+        assign_object(self, 'fb_message', content)
+
+    @property
+    def chatbase_fields(self):
+        """The ChatbaseFields of the message."""
+        fields = assigned_object(self, 'chatbase_fields')
+        if fields is None:
+            return ChatbaseFieldsView(self)
+        return fields
+
+    @chatbase_fields.setter
+    def chatbase_fields(self, fields):
+        assign_object(self, 'chatbase_fields', fields)
+
+    def get_user_key(self):
+        """Return the id of the user this message belongs to: the sender."""
+        if '_assigned' in self.__dict__:
+            return self.sender.id
+        return self._sender_id
 
     def set_recipient_id(self, rec_id):
         """Set the recipient id."""
-        self.recipient.id = rec_id
+        if '_assigned' in self.__dict__:
+            self.recipient.id = rec_id
+        else:
+            self._recipient_id = rec_id
 
     def set_sender_id(self, snd_id):
         """Set the sender id."""
-        self.sender.id = snd_id
+        if '_assigned' in self.__dict__:
+            self.sender.id = snd_id
+        else:
+            self._sender_id = snd_id
 
     def set_message_id(self, msg_id):
         """Set the message id."""
-        self.fb_message.mid = msg_id
+        if '_assigned' in self.__dict__:
+            self.fb_message.mid = msg_id
+        else:
+            self._mid = msg_id
 
     def set_chatbase_fields(self):
-        """Extract chatbase fields from instance and format for transmission."""
+        """Extract chatbase fields from instance and format for transmission.
+        Only assigned objects need the copy; the views read the instance.
+        """
+        if '_assigned' not in self.__dict__:
+            return
         self.chatbase_fields.intent = self.intent
         self.chatbase_fields.version = self.version
         self.chatbase_fields.not_handled = self.not_handled
@@ -57,33 +158,42 @@ class FacebookUserMessage(Message):
 
     def to_json(self):
         """Return a JSON version for use with the Chatbase API"""
-        self.set_chatbase_fields()
-        return json.dumps({
-            'sender': self.sender,
-            'recipient': self.recipient,
-            'timestamp': self.timestamp,
-            'message': self.fb_message,
-            'chatbase_fields': self.chatbase_fields
-        }, default=lambda i: i.__dict__)
+        return json.dumps(self.to_set_format(), default=lambda i: i.__dict__)
 
     def to_set_format(self):
         """Return a dictionary version of the message for a set"""
-        self.set_chatbase_fields()
+        if '_assigned' in self.__dict__:
+            self.set_chatbase_fields()
+            sender_id = self.sender.id
+            recipient_id = self.recipient.id
+            mid = self.fb_message.mid
+        else:
+            sender_id = self._sender_id
+            recipient_id = self._recipient_id
+            mid = self._mid
         return {
-            'sender': self.sender,
-            'recipient': self.recipient,
+            'sender': {'id': sender_id},
+            'recipient': {'id': recipient_id},
             'timestamp': self.timestamp,
-            'message': self.fb_message,
-            'chatbase_fields': self.chatbase_fields
+            'message': {'mid': mid, 'text': self.message},
+            'chatbase_fields': {
+                'intent': self.intent,
+                'version': self.version,
+                'not_handled': self.not_handled,
+                'feedback': self.feedback
+            }
         }
 
-    def send(self):
-        """Send the message to the Chatbase API."""
-        url = ("https://chatbase.com/api/facebook/send_message?api_key=%s" %
+    def get_url(self):
+        """Return the Chatbase API endpoint for this message."""
+        return ("https://chatbase.com/api/facebook/send_message?api_key=%s" %
                self.api_key)
-        return requests.post(url,
-                             data=self.to_json(),
-                             headers=Message.get_content_type())
+
+    def send(self, transport=None):
+        """Send the message to the Chatbase API."""
+        return get_transport(transport).post(self.get_url(),
+                                             data=self.to_json(),
+                                             headers=Message.get_content_type())
 
 class FacebookUserMessageSet(object):
     """Message Set.
@@ -92,11 +202,40 @@ class FacebookUserMessageSet(object):
 
     def __init__(self,
                  api_key="",
-                 version=""):
+                 version="",
+                 sampler=None,
+                 validate_on_send=False):
         self.api_key = api_key
         self.version = version
+        self.sampler = sampler
+        self.validate_on_send = validate_on_send
+        self.validation_errors = []
         self.messages = []
 
+    _fields = ('api_key', 'version', 'sampler', 'validate_on_send',
+               'validation_errors', 'messages')
+    _get_fields = operator.itemgetter(*_fields)
+
+    def __reduce__(self):
+        return reduce_state(self, self._fields)
+
+    def _get_state(self):
+        """Return the flat tuple of values pickled for this set."""
+        state = self._get_fields(self.__dict__)
+        return state[:-1] + (pack_messages(state[-1]),)
+
+    def _set_state(self, state):
+        """Restore the values returned by _get_state."""
+        self.__dict__.update(zip(self._fields, state))
+        self.messages = unpack_messages(self.messages)
+
+    def __setstate__(self, state):
+        """Restore a set pickled by releases without the sampler and
+        validation options, which are given their defaults.
+        """
+        self.__init__()
+        self.__dict__.update(state)
+
     def new_message(self, intent="", message=""):
         """Add a message to the internal messages list and return it"""
         self.messages.append(FacebookUserMessage(api_key=self.api_key,
@@ -107,13 +246,44 @@ class FacebookUserMessageSet(object):
 
     def to_json(self):
         """Return a JSON version for use with the Chatbase API"""
-        msgs = [msg.to_set_format() for msg in self.messages]
+        msgs = [msg.to_set_format() for msg in self.messages_to_send()]
         return json.dumps({"messages": msgs}, default=lambda i: i.__dict__)
 
-    def send(self):
-        """Send the message set to the Chatbase API"""
-        url = ("https://chatbase.com/api/facebook/message_received_batch?api_key=%s"
+    def messages_to_send(self):
+        """Return the messages kept by the set's sampler and, when the set
+        validates on send, by their validation_rules. The FieldErrors of
+        the messages dropped are kept in validation_errors.
+        """
+        messages = self.messages
+        if self.sampler is not None:
+            messages = self.sampler.filter(messages)
+        if self.validate_on_send:
+            messages, self.validation_errors = validate_messages(messages)
+        return messages
+
+    def get_url(self):
+        """Return the Chatbase API endpoint for this message set."""
+        return ("https://chatbase.com/api/facebook/message_received_batch?api_key=%s"
                % self.api_key)
-        return requests.post(url,
-                             data=self.to_json(),
-                             headers=Message.get_content_type())
+
+    def send(self, transport=None):
+        """Send the message set to the Chatbase API"""
+        return get_transport(transport).post(self.get_url(),
+                                             data=self.to_json(),
+                                             headers=Message.get_content_type())
+
+    def send_with_results(self, transport=None):
+        """Send the message set and return its per-message BatchResult."""
+        return send_with_results(self, transport)
+
+    def retry_failed(self, result, transport=None):
+        """Resend only the messages that failed in a previous BatchResult."""
+        return retry_failed(self, result, transport)
+
+    def validate(self):
+        """Return a FieldError for every rule the messages of the set break."""
+        return validate_messages(self.messages)[1]
+
+    def drop_invalid(self):
+        """Remove invalid messages from the set and return their FieldErrors."""
+        return drop_invalid(self)
@@ -0,0 +1,130 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Send messages concurrently while keeping each user's messages in order."""
+
+import collections
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class OrderedDispatcher(object):
+    """Ordered Dispatcher.
+    Messages are partitioned into one lane per user (see get_user_key()).
+    A lane has at most one message in flight, so a user's messages reach the
+    API in submission order, while a pool of worker threads serves the
+    lanes of distinct users concurrently, round-robin.
+
+    callback, when given, is called from a worker thread as
+    callback(message, response, error) after each send; error is the
+    exception raised by send() or None.
+    """
+
+    def __init__(self, workers=8, transport=None, callback=None):
+        self.transport = transport
+        self.callback = callback
+        self._cond = threading.Condition()
+        self._lanes = {}
+        self._ready = collections.deque()
+        self._closed = False
+        self._threads = []
+        for _ in range(max(1, workers)):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, message_object):
+        """Queue a message behind the earlier messages of its user."""
+        key = message_object.get_user_key()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('Cannot submit to a closed '
+                                   'OrderedDispatcher')
+            lane = self._lanes.get(key)
+            if lane is None:
+                self._lanes[key] = collections.deque([message_object])
+                self._ready.append(key)
+                self._cond.notify_all()
+            else:
+                lane.append(message_object)
+
+    def pending_count(self):
+        """Return the number of messages not yet sent."""
+        with self._cond:
+            return sum(len(lane) for lane in self._lanes.values())
+
+    def _work(self):
+        """Worker loop: send the head of a ready lane, then requeue it."""
+        while True:
+            with self._cond:
+                while not self._ready and not self._closed:
+                    self._cond.wait()
+                if not self._ready:
+                    return
+                key = self._ready.popleft()
+                message_object = self._lanes[key][0]
+            try:
+                self._send(message_object)
+            finally:
+                with self._cond:
+                    lane = self._lanes[key]
+                    lane.popleft()
+                    if lane:
+                        self._ready.append(key)
+                    else:
+                        del self._lanes[key]
+                    self._cond.notify_all()
+
+    def _send(self, message_object):
+        """Send a message and report it to the callback, logging errors."""
+        response, error = None, None
+        try:
+            response = message_object.send(self.transport)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.exception('Sending %r failed', message_object)
+            error = exc
+        if self.callback is None:
+            return
+        try:
+            self.callback(message_object, response, error)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception('Callback for %r failed', message_object)
+
+    def join(self, timeout=None):
+        """Wait until every submitted message was sent.
+        Returns False if timeout seconds passed first.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._lanes:
+                if deadline is None:
+                    self._cond.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=None):
+        """Wait for pending messages, then stop the worker threads."""
+        drained = self.join(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        return drained
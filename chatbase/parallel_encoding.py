@@ -0,0 +1,140 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Encode large message sets across a pool of worker processes.
+
+The messages of a set are split into shards which workers encode into
+UTF-8 JSON fragments; the parent stitches the fragments into one or more
+batch request bodies, byte-for-byte equal to what to_json() produces.
+
+Forking a process while other threads are alive can deadlock the child on
+a lock one of those threads held, e.g. logging's. Pools are therefore only
+forked while the calling thread is the only one; otherwise they are
+started with forkserver (or spawn) and the messages are pickled to the
+workers. Python 2 has no such choice and always forks.
+"""
+
+import json
+import multiprocessing
+import os
+import threading
+from .base_message import Message
+from .transport import get_transport
+
+
+def _encode_shard(messages):
+    """Encode each message of a shard into a JSON bytes fragment."""
+    return [json.dumps(msg.to_set_format(),
+                       default=lambda i: i.__dict__).encode('utf-8')
+            for msg in messages]
+
+
+# Messages of the set being encoded, inherited by forked workers
+_forked_messages = None
+
+
+def _encode_range(bounds):
+    """Encode a slice of the messages inherited from the parent process."""
+    start, stop = bounds
+    return _encode_shard(_forked_messages[start:stop])
+
+
+def _can_fork():
+    """True when new pools fork, sharing the parent's memory."""
+    get_start_method = getattr(multiprocessing, 'get_start_method', None)
+    if get_start_method is None:  # Python 2 always forks on POSIX
+        return hasattr(os, 'fork')
+    return get_start_method() == 'fork'
+
+
+def _new_pool(processes):
+    """Return a pool that does not fork while other threads are alive."""
+    get_context = getattr(multiprocessing, 'get_context', None)
+    if get_context is None or not _can_fork():
+        return multiprocessing.Pool(processes)
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return get_context('forkserver').Pool(processes)
+    return get_context('spawn').Pool(processes)
+
+
+def _stitch(fragments):
+    """Join encoded message fragments into a batch request body."""
+    return b'{"messages": [' + b', '.join(fragments) + b']}'
+
+
+def _collect(pool, func, shards, close):
+    """Map func over shards on pool and concatenate the fragments."""
+    try:
+        fragments = []
+        for shard_fragments in pool.imap(func, shards):
+            fragments.extend(shard_fragments)
+        return fragments
+    finally:
+        if close:
+            pool.close()
+            pool.join()
+
+
+def encode_parallel(message_set,
+                    processes=None,
+                    shard_size=5000,
+                    batch_size=None,
+                    pool=None):
+    """Encode message_set into a list of batch request bodies (bytes).
+    Shards of shard_size messages are encoded on a multiprocessing pool of
+    processes workers (one per core by default), or on pool when given.
+    Sets no larger than one shard are encoded inline. With batch_size the
+    messages are split into bodies of at most that many messages, otherwise
+    a single body is returned. Sets with messages spilled to disk are
+    rejected; a SpillingMessageSet streams its batches with send() instead.
+    """
+    global _forked_messages
+    if getattr(message_set, 'spilled_count', 0):
+        raise ValueError('encode_parallel cannot encode spilled messages')
+    messages = message_set.messages_to_send()
+    bounds = [(i, min(i + shard_size, len(messages)))
+              for i in range(0, len(messages), shard_size)]
+    if len(bounds) <= 1:
+        fragments = _encode_shard(messages)
+    elif pool is None and _can_fork() and threading.active_count() == 1:
+        # Forked workers read the messages from inherited memory, so only
+        # the shard bounds are pickled
+        _forked_messages = messages
+        try:
+            pool = multiprocessing.Pool(processes)
+        finally:
+            _forked_messages = None
+        fragments = _collect(pool, _encode_range, bounds, close=True)
+    else:
+        own_pool = pool is None
+        if own_pool:
+            pool = _new_pool(processes)
+        shards = [messages[start:stop] for start, stop in bounds]
+        fragments = _collect(pool, _encode_shard, shards, close=own_pool)
+    if not batch_size:
+        return [_stitch(fragments)]
+    return [_stitch(fragments[i:i + batch_size])
+            for i in range(0, len(fragments), batch_size)] or [_stitch([])]
+
+
+def send_parallel(message_set, transport=None, **kwargs):
+    """Encode message_set with encode_parallel() and send each body.
+    Keyword arguments are passed to encode_parallel(). Returns the list of
+    responses, one per batch.
+    """
+    transport = get_transport(transport)
+    return [transport.post(message_set.get_url(),
+                           data=body,
+                           headers=Message.get_content_type())
+            for body in encode_parallel(message_set, **kwargs)]
@@ -0,0 +1,81 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compact pickling for messages and message sets.
+
+Instead of their __dict__ (and the __dict__ of every nested object), the
+message and set classes pickle as a flat tuple of field values produced by
+their _get_state() method and restored by _set_state(). Attributes a caller
+added to an instance are carried along in an extra dict. Sets pack their
+messages into rows of field values (see pack_messages), which round trip
+without a reduce call per message.
+"""
+
+
+def reduce_state(obj, fields):
+    """Return the __reduce__ value for obj whose own attributes are fields."""
+    attrs = obj.__dict__
+    if len(attrs) == len(fields):
+        return (restore_state, (type(obj), obj._get_state()))
+    extras = dict((k, v) for k, v in attrs.items() if k not in fields)
+    return (restore_state, (type(obj), obj._get_state(), extras))
+
+
+def restore_state(cls, state, extras=None):
+    """Rebuild an instance of cls pickled by reduce_state()."""
+    obj = cls.__new__(cls)
+    obj._set_state(state)
+    if extras:
+        obj.__dict__.update(extras)
+    return obj
+
+
+def pack_messages(messages):
+    """Return messages in a compact picklable form.
+    When the messages are distinct instances of one class, each holding
+    exactly that class's _fields, they are packed as (class, rows of field
+    values). Otherwise a plain list of the messages is returned.
+    """
+    messages = list(messages)
+    if not messages:
+        return messages
+    cls = type(messages[0])
+    fields = getattr(cls, '_fields', None)
+    if fields is None:
+        return messages
+    count = len(fields)
+    get = cls._get_fields
+    try:
+        rows = [get(m.__dict__) for m in messages
+                if type(m) is cls and len(m.__dict__) == count]
+    except KeyError:
+        return messages
+    if len(rows) != len(messages) or len(set(map(id, messages))) != len(rows):
+        return messages
+    return cls, rows
+
+
+def unpack_messages(packed):
+    """Return the list of messages packed by pack_messages()."""
+    if isinstance(packed, list):
+        return packed
+    cls, rows = packed
+    fields = cls._fields
+    new = cls.__new__
+    messages = []
+    for row in rows:
+        message_object = new(cls)
+        message_object.__dict__ = dict(zip(fields, row))
+        messages.append(message_object)
+    return messages
@@ -0,0 +1,188 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Replay captured traffic as a load generator.
+
+Usage:
+    python -m chatbase.replay capture.cbcap --endpoint http://localhost:8080 \\
+        --speed 10 --concurrency 32 --api-key test-key
+"""
+
+import argparse
+import threading
+import time
+import requests
+
+try:
+    from urllib.parse import urlsplit, urlunsplit
+except ImportError:  # Python 2
+    from urlparse import urlsplit, urlunsplit
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+from .base_message import Message
+from .capture import read_capture, replace_api_key
+from .transport import RequestsTransport, get_transport
+
+
+class ReplayReport(object):
+    """Throughput and latency figures from a replay run."""
+
+    def __init__(self, latencies, errors, elapsed):
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.elapsed = elapsed
+
+    @property
+    def sent(self):
+        """Number of requests issued."""
+        return len(self.latencies)
+
+    @property
+    def throughput(self):
+        """Requests per second over the whole run."""
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, pct):
+        """Return the nearest-rank latency percentile in seconds."""
+        if not self.latencies:
+            return 0.0
+        rank = int(round(pct / 100.0 * len(self.latencies))) - 1
+        return self.latencies[min(max(rank, 0), len(self.latencies) - 1)]
+
+    def __str__(self):
+        return ('sent=%d errors=%d elapsed=%.2fs throughput=%.1f req/s '
+                'p50=%.1fms p90=%.1fms p99=%.1fms max=%.1fms' % (
+                    self.sent, self.errors, self.elapsed, self.throughput,
+                    self.percentile(50) * 1e3, self.percentile(90) * 1e3,
+                    self.percentile(99) * 1e3, self.percentile(100) * 1e3))
+
+
+def rewrite_url(url, endpoint):
+    """Point url at endpoint, keeping its path and query string.
+    A path on endpoint is prepended to the captured path.
+    """
+    if not endpoint:
+        return url
+    original = urlsplit(url)
+    target = urlsplit(endpoint)
+    return urlunsplit((target.scheme, target.netloc,
+                       target.path.rstrip('/') + original.path,
+                       original.query, original.fragment))
+
+
+def pooled_transport(concurrency, timeout=None):
+    """Return a RequestsTransport whose pool keeps concurrency connections
+    per host, so concurrent workers do not discard and reopen connections.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return RequestsTransport(session, timeout)
+
+
+def replay(path, endpoint=None, speed=1.0, concurrency=8, transport=None,
+           api_key=None):
+    """Re-issue the requests in a capture file and return a ReplayReport.
+    Requests keep their captured spacing divided by speed; a speed of None
+    sends them as fast as the concurrency allows. At most concurrency
+    requests are in flight at once. Latency is measured from the time a
+    request was scheduled, so time spent waiting for a free worker counts.
+    When transport is None and the default transport is a
+    RequestsTransport, a pool sized for concurrency is used instead.
+    Captured requests carry the API keys they were sent with; when api_key
+    is not None it replaces them, so replaying against a test endpoint
+    does not hand it production keys.
+    """
+    owned = None
+    if transport is None:
+        transport = get_transport()
+        if type(transport) is RequestsTransport:
+            transport = owned = pooled_transport(concurrency,
+                                                 transport.timeout)
+    headers = Message.get_content_type()
+    pending = queue.Queue(maxsize=concurrency * 2)
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            request = pending.get()
+            if request is None:
+                return
+            try:
+                failed = transport.post(request.url, request.data,
+                                        headers).status_code >= 400
+            except Exception:  # pylint: disable=broad-except
+                failed = True
+            latency = time.time() - request.scheduled
+            with lock:
+                latencies.append(latency)
+                errors[0] += failed
+
+    workers = [threading.Thread(target=work) for _ in range(concurrency)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    start = time.time()
+    for request in read_capture(path):
+        if speed:
+            request.scheduled = start + request.offset / speed
+            delay = request.scheduled - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        else:
+            request.scheduled = time.time()
+        request.url = rewrite_url(request.url, endpoint)
+        if api_key is not None:
+            request.url, request.data = replace_api_key(request.url,
+                                                        request.data,
+                                                        api_key)
+        pending.put(request)
+    for _ in workers:
+        pending.put(None)
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - start
+    if owned is not None:
+        owned.close()
+    return ReplayReport(latencies, errors[0], elapsed)
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description='Replay captured Chatbase '
+                                     'traffic against an endpoint.')
+    parser.add_argument('capture', help='capture file to replay')
+    parser.add_argument('--endpoint', default=None,
+                        help='scheme://host[:port][/path] to send to '
+                        '(default: the captured URLs)')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='speed-up factor; 0 sends as fast as possible')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='maximum requests in flight')
+    parser.add_argument('--api-key', default=None,
+                        help='API key sent in place of the captured ones')
+    args = parser.parse_args(argv)
+    print(replay(args.capture, endpoint=args.endpoint, speed=args.speed,
+                 concurrency=args.concurrency, api_key=args.api_key))
+
+
+if __name__ == '__main__':
+    main()
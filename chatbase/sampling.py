@@ -0,0 +1,56 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Keep or drop whole users by a stable hash of their id."""
+
+import hashlib
+
+
+class Sampler(object):
+    """Deterministic per-user sampler.
+    A user is hashed to a bucket in [0, 1) and kept when the bucket is below
+    the sampling rate, so every message of a kept user is sent, in every
+    process and across restarts. intent_rates overrides the rate for given
+    intents; as the bucket is the same for all intents, a user kept at a
+    lower rate is also kept at every higher one.
+    """
+
+    def __init__(self, rate=1.0, intent_rates=None, salt=""):
+        self.rate = rate
+        self.intent_rates = intent_rates or {}
+        self.salt = salt
+
+    def bucket(self, user_key):
+        """Return the stable bucket in [0, 1) of a user id."""
+        key = (self.salt + str(user_key)).encode('utf-8')
+        return int(hashlib.md5(key).hexdigest()[:15], 16) / float(16 ** 15)
+
+    def keep(self, user_key, intent=None):
+        """Return True when messages of user_key for intent are sent.
+        Call this before building a message to skip sampled-out traffic.
+        """
+        rate = self.intent_rates.get(intent, self.rate)
+        if rate >= 1:
+            return True
+        if rate <= 0:
+            return False
+        return self.bucket(user_key) < rate
+
+    def keep_message(self, msg):
+        """Return True when msg is sent."""
+        return self.keep(msg.get_user_key(), msg.intent)
+
+    def filter(self, messages):
+        """Return the messages which are sent."""
+        return [msg for msg in messages if self.keep_message(msg)]
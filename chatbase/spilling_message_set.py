@@ -0,0 +1,310 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Define a MessageSet that spills older messages to disk."""
+
+import collections
+import json
+import operator
+import tempfile
+import threading
+from .base_message import Message, MessageSet
+from .batch_result import BatchResult
+from .pickling import pack_messages, reduce_state, unpack_messages
+from .transport import TransportResponse, get_transport
+from .validation import validate_messages
+
+# Bytes read from the spill file per lock acquisition
+_SPILL_READ_SIZE = 64 * 1024
+
+
+class BatchResponses(object):
+    """The responses to the batch requests of one send.
+    Behaves like the worst of them: status_code, text and json() are those
+    of the response with the highest status code, so a caller checking
+    status_code >= 400 sees any failed batch. Sending nothing is a 200.
+    """
+
+    def __init__(self, responses):
+        self.responses = responses
+        if responses:
+            self._worst = max(responses, key=lambda r: r.status_code)
+        else:
+            self._worst = TransportResponse()
+
+    @property
+    def status_code(self):
+        """The highest status code of the batch responses."""
+        return self._worst.status_code
+
+    @property
+    def text(self):
+        """The body of the worst batch response."""
+        return self._worst.text
+
+    def json(self):
+        """Return the decoded body of the worst batch response."""
+        return self._worst.json()
+
+
+class SpillingMessageSet(MessageSet):
+    """Spilling Message Set.
+    Keep at most max_in_memory messages in memory. Older messages are
+    encoded as compact JSON lines into a temporary file, and send() streams
+    them back as batch requests of at most batch_size messages each.
+    Messages are encoded when spilled, so later changes to a spilled
+    Message instance are not sent. With validate_on_send, messages are
+    also validated when spilled, and the invalid ones are dropped.
+    """
+
+    def __init__(self,
+                 api_key="",
+                 platform="",
+                 version="",
+                 user_id="",
+                 max_in_memory=1000,
+                 batch_size=1000,
+                 spill_dir=None,
+                 sampler=None,
+                 validate_on_send=False):
+        super(SpillingMessageSet, self).__init__(
+            api_key=api_key,
+            platform=platform,
+            version=version,
+            user_id=user_id,
+            sampler=sampler,
+            validate_on_send=validate_on_send)
+        self.max_in_memory = max_in_memory
+        self.batch_size = batch_size
+        self.spill_dir = spill_dir
+        self.spilled_count = 0
+        self.dropped_count = 0
+        self._spill_errors = []
+        self._spill_file = None
+        self._spill_lock = threading.Lock()
+
+    # Attributes pickled, in order, by __reduce__; the spill file is pickled
+    # as the list of its encoded lines and rewritten to a new temporary file
+    # and the lock guarding it is created anew
+    _fields = ('api_key', 'platform', 'version', 'user_id', 'sampler',
+               'validate_on_send', 'validation_errors', 'max_in_memory',
+               'batch_size', 'spill_dir', 'spilled_count', 'dropped_count',
+               '_spill_errors', '_messages', '_spill_file', '_spill_lock')
+    _get_fields = operator.itemgetter(*_fields[:-3])
+
+    def __reduce__(self):
+        return reduce_state(self, self._fields)
+
+    def _get_state(self):
+        """Return the flat tuple of values pickled for this set."""
+        spilled = list(self._iter_spilled())
+        return self._get_fields(self.__dict__) + (
+            pack_messages(self.messages), spilled)
+
+    def _set_state(self, state):
+        """Restore the values returned by _get_state."""
+        self.__dict__.update(zip(self._fields[:-3], state[:-2]))
+        self.messages = unpack_messages(state[-2])
+        self._spill_file = None
+        self._spill_lock = threading.Lock()
+        if state[-1]:
+            self._spill_file = tempfile.TemporaryFile(dir=self.spill_dir)
+            for encoded in state[-1]:
+                self._spill_file.write(encoded.encode('utf-8') + b'\n')
+
+    @property
+    def messages(self):
+        """The messages held in memory, oldest first."""
+        return self._messages
+
+    @messages.setter
+    def messages(self, messages):
+        self._messages = collections.deque(messages)
+
+    def __len__(self):
+        return self.spilled_count + len(self.messages)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __copy__(self):
+        """Return a set with the same settings and in-memory messages but
+        nothing spilled, so the subsets sent by retry_failed() do not send
+        the spilled messages again.
+        """
+        subset = type(self).__new__(type(self))
+        subset.__dict__.update(self.__dict__)
+        subset.messages = self.messages
+        subset.spilled_count = 0
+        subset.dropped_count = 0
+        subset._spill_errors = []
+        subset._spill_file = None
+        subset._spill_lock = threading.Lock()
+        return subset
+
+    @staticmethod
+    def encode_message(message_object):
+        """Return the compact JSON encoding of a message."""
+        return json.dumps(message_object.to_set_format(),
+                          separators=(',', ':'),
+                          default=lambda i: i.__dict__)
+
+    def _add_message(self, message_object):
+        """Append a Message object to the set, spilling the oldest in-memory
+        message to disk when more than max_in_memory are held.
+        """
+        self.messages.append(message_object)
+        if len(self.messages) > self.max_in_memory:
+            self._spill(self.messages.popleft())
+
+    def _spill(self, message_object):
+        """Write a message to the spill file, or drop it if invalid."""
+        if self.validate_on_send:
+            errors = validate_messages([message_object])[1]
+            if errors:
+                for error in errors:
+                    error.index = self.spilled_count + self.dropped_count
+                self._spill_errors.extend(errors)
+                self.dropped_count += 1
+                return
+        line = self.encode_message(message_object).encode('utf-8') + b'\n'
+        with self._spill_lock:
+            if self._spill_file is None:
+                self._spill_file = tempfile.TemporaryFile(dir=self.spill_dir)
+            self._spill_file.seek(0, 2)
+            self._spill_file.write(line)
+        self.spilled_count += 1
+
+    def messages_to_send(self):
+        """Return the in-memory messages to send. When the set validates on
+        send the invalid ones are dropped, and validation_errors lists the
+        FieldErrors of the messages dropped when spilled followed by those
+        of the in-memory ones, indexed in the order they were appended.
+        """
+        messages = list(self.messages)
+        if self.validate_on_send:
+            messages, errors = validate_messages(messages)
+            for error in errors:
+                error.index += self.spilled_count + self.dropped_count
+            self.validation_errors = self._spill_errors + errors
+        return messages
+
+    def _iter_spilled(self):
+        """Yield the encoded spilled messages, oldest first.
+        Each reader keeps its own offset and reads blocks under the spill
+        lock, so a send and a pickle of the set (as BatchSender.flush() does
+        with in flight items) can read the file at the same time.
+        """
+        remaining = self.spilled_count
+        offset = 0
+        tail = b''
+        while remaining:
+            with self._spill_lock:
+                if self._spill_file is None:
+                    return
+                self._spill_file.seek(offset)
+                block = self._spill_file.read(_SPILL_READ_SIZE)
+            if not block:
+                return
+            offset += len(block)
+            lines = (tail + block).split(b'\n')
+            tail = lines.pop()
+            for line in lines[:remaining]:
+                yield line.decode('utf-8')
+            remaining -= min(remaining, len(lines))
+
+    def _iter_encoded(self):
+        """Yield (encoded message, Message) pairs of the set, oldest first.
+        Spilled messages are paired with None.
+        """
+        for encoded in self._iter_spilled():
+            yield encoded, None
+        for message_object in self.messages_to_send():
+            yield self.encode_message(message_object), message_object
+
+    def _iter_batches(self):
+        """Yield (batch request body, Messages) pairs of at most batch_size
+        messages, with None in place of the spilled messages.
+        """
+        batch = []
+        messages = []
+        for encoded, message_object in self._iter_encoded():
+            batch.append(encoded)
+            messages.append(message_object)
+            if len(batch) >= self.batch_size:
+                yield '{"messages":[%s]}' % ','.join(batch), messages
+                batch = []
+                messages = []
+        if batch:
+            yield '{"messages":[%s]}' % ','.join(batch), messages
+
+    def iter_encoded_messages(self):
+        """Yield the encoded messages of the set, oldest first."""
+        for encoded, _ in self._iter_encoded():
+            yield encoded
+
+    def iter_batches(self):
+        """Yield batch request bodies of at most batch_size messages."""
+        for body, _ in self._iter_batches():
+            yield body
+
+    def to_json(self):
+        """Return a JSON version of the whole set.
+        This holds every message in memory at once; send() streams instead.
+        """
+        return '{"messages":[%s]}' % ','.join(self.iter_encoded_messages())
+
+    def send(self, transport=None):
+        """Send the set to the Chatbase API in batches.
+        Returns a BatchResponses holding the response of every batch.
+        """
+        transport = get_transport(transport)
+        headers = Message.get_content_type()
+        return BatchResponses([transport.post(self.get_url(),
+                                              data=body,
+                                              headers=headers)
+                               for body in self.iter_batches()])
+
+    def send_with_results(self, transport=None):
+        """Send the set in batches and return its BatchResult.
+        Spilled messages have no Message instance left, so their results
+        carry None as message: they count towards all_succeeded and failed
+        but retry_failed() cannot resend them. result.response is a
+        BatchResponses.
+        """
+        transport = get_transport(transport)
+        headers = Message.get_content_type()
+        responses = []
+        results = []
+        for body, messages in self._iter_batches():
+            response = transport.post(self.get_url(),
+                                      data=body,
+                                      headers=headers)
+            responses.append(response)
+            results.extend(BatchResult.from_response(response,
+                                                     messages).results)
+        return BatchResult(BatchResponses(responses), results)
+
+    def close(self):
+        """Delete the spill file and the messages spilled to it."""
+        with self._spill_lock:
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+        self.spilled_count = 0
+        self.dropped_count = 0
+        self._spill_errors = []
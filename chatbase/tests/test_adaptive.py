@@ -0,0 +1,119 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import threading
+import time
+import unittest
+from chatbase import *
+
+
+class TestAdaptiveController(unittest.TestCase):
+    def test_additive_increase_within_bounds(self):
+        c = AdaptiveController(min_batch_size=10, max_batch_size=35,
+                               max_concurrency=3, target_latency=1)
+        for _ in range(20):
+            c.record(time.time(), 0.1, True)
+        self.assertEqual(c.batch_size, 35)
+        self.assertEqual(c.concurrency, 3)
+
+    def test_multiplicative_decrease(self):
+        c = AdaptiveController(min_batch_size=10, max_batch_size=1000,
+                               max_concurrency=8, target_latency=1)
+        for _ in range(40):
+            c.record(time.time(), 0.1, True)
+        batch_size, concurrency = c.batch_size, c.concurrency
+        started = time.time()
+        c.record(started, 2.0, True)
+        self.assertEqual(c.batch_size, batch_size // 2)
+        self.assertEqual(c.concurrency, concurrency // 2)
+        # a batch started before that decrease does not shrink again
+        c.record(started - 1, 0.1, False)
+        self.assertEqual(c.batch_size, batch_size // 2)
+        for _ in range(10):
+            c.record(time.time(), 0.1, False)
+        self.assertEqual((c.batch_size, c.concurrency), (10, 1))
+
+
+class TestSendAdaptive(unittest.TestCase):
+    def test_sends_every_message_once_in_order(self):
+        s = FacebookUserMessageSet(api_key='k')
+        for i in range(200):
+            s.new_message(message=str(i))
+        t = InMemoryTransport()
+        c = AdaptiveController(min_batch_size=5, max_batch_size=50,
+                               max_concurrency=4)
+        results = send_adaptive(s, controller=c, transport=t)
+        sent = [m['message']['text'] for r in t.requests
+                for m in r.json()['messages']]
+        self.assertEqual(sorted(sent, key=int), [str(i) for i in range(200)])
+        self.assertEqual([r.message.message for b in results
+                          for r in b.results], [str(i) for i in range(200)])
+        self.assertTrue(all(b.all_succeeded for b in results))
+        self.assertTrue(len(t.requests[-1].json()['messages']) > 5)
+        self.assertEqual(t.requests[0].url, s.get_url())
+
+    def test_errors_shrink_batches(self):
+        s = MessageSet(api_key='k', platform='p', user_id='u')
+        for i in range(60):
+            s.new_message(message=str(i))
+
+        def fail(request):
+            raise IOError('connection reset')
+        c = AdaptiveController(min_batch_size=5, max_batch_size=50)
+        c.batch_size = 40
+        results = send_adaptive(s, controller=c,
+                                transport=InMemoryTransport(responder=fail))
+        self.assertEqual([len(b.results) for b in results], [40, 20])
+        self.assertEqual(c.batch_size, 10)
+        self.assertEqual(sum(len(b.failed) for b in results), 60)
+        self.assertEqual(results[0].failed[0].error, 'connection reset')
+
+    def test_rejected_messages_shrink_batches(self):
+        s = MessageSet(api_key='k', platform='p', user_id='u')
+        for i in range(30):
+            s.new_message(message=str(i))
+
+        def reject_first(request):
+            entries = [{'status': 'success'}
+                       for _ in request.json()['messages']]
+            entries[0] = {'status': 'error', 'error': 'bad'}
+            return TransportResponse(200, json.dumps({'responses': entries}))
+        c = AdaptiveController(min_batch_size=5, max_batch_size=50)
+        c.batch_size = 20
+        results = send_adaptive(s, controller=c,
+                                transport=InMemoryTransport(reject_first))
+        self.assertEqual([len(b.results) for b in results], [20, 10])
+        self.assertEqual(c.batch_size, 5)
+
+    def test_thread_count_is_bounded(self):
+        s = MessageSet(api_key='k', platform='p', user_id='u')
+        for i in range(100):
+            s.new_message(message=str(i))
+        baseline = threading.active_count()
+        seen = []
+
+        def respond(request):
+            seen.append(threading.active_count())
+            return TransportResponse()
+        c = AdaptiveController(min_batch_size=1, max_batch_size=1,
+                               max_concurrency=3)
+        results = send_adaptive(s, controller=c,
+                                transport=InMemoryTransport(respond))
+        self.assertEqual(len(results), 100)
+        self.assertTrue(max(seen) <= baseline + 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
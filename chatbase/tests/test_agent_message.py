@@ -43,6 +43,61 @@ class TestAgentMessage(unittest.TestCase):
         i.set_message_id(msg_id)
         self.assertEqual(i.response_body.message_id, msg_id)
 
+    def test_nested_views(self):
+        i = FacebookAgentMessage(message='hello')
+        i.request_body.recipient.id = 'rec'
+        i.request_body.message.mid = 'mid'
+        self.assertEqual(i.get_user_key(), 'rec')
+        self.assertEqual(i.response_body.recipient_id, '')
+        self.assertEqual(i.request_body.message.text, 'hello')
+        self.assertEqual(i.request_body.timestamp, i.time_stamp)
+        self.assertTrue(isinstance(i.request_body.recipient, FacebookID))
+        body = FacebookAgentMessageResponseBody()
+        body.message_id = 'resp'
+        i.response_body = body
+        self.assertEqual(json.loads(i.to_json())['response_body'],
+                         {'recipient_id': '', 'message_id': 'resp'})
+        self.assertEqual(json.loads(json.dumps(i.request_body,
+                                               default=lambda o: o.__dict__)),
+                         json.loads(i.to_json())['request_body'])
+
+    def test_assigning_views(self):
+        i = FacebookAgentMessage(intent='int', message='keep')
+        content = FacebookUserMessageContent()
+        content.mid = 'mid'
+        i.request_body.message = content
+        self.assertIs(i.request_body.message, content)
+        self.assertEqual(i.message, 'keep')
+        body = FacebookAgentMessageRequestBody()
+        body.recipient.id = 'rec'
+        body.message.mid = 'mid2'
+        i.request_body = body
+        fields = ChatbaseFields()
+        fields.intent = 'assigned'
+        i.chatbase_fields = fields
+        self.assertEqual(i.chatbase_fields.intent, 'assigned')
+        encoded = json.loads(i.to_json())
+        self.assertEqual(encoded['request_body']['message'],
+                         {'mid': 'mid2', 'text': 'keep'})
+        self.assertEqual(encoded['request_body']['recipient'], {'id': 'rec'})
+        self.assertEqual(encoded['chatbase_fields']['intent'], 'int')
+
+    def test_assigned_objects_stay_live(self):
+        i = FacebookAgentMessage(message='hello')
+        recipient = FacebookID()
+        i.request_body.recipient = recipient
+        recipient.id = '123'
+        self.assertEqual(i.request_body.recipient.id, '123')
+        self.assertEqual(i.get_user_key(), '123')
+        body = FacebookAgentMessageResponseBody()
+        i.response_body = body
+        i.set_message_id('m')
+        self.assertEqual(body.message_id, 'm')
+        encoded = json.loads(i.to_json())
+        self.assertEqual(encoded['request_body']['recipient'], {'id': '123'})
+        self.assertEqual(encoded['request_body']['message']['mid'], 'm')
+        self.assertEqual(encoded['response_body']['message_id'], 'm')
+
     def test_json_encoding(self):
         intent = 'test'
         version = 'test1'
@@ -0,0 +1,87 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+from chatbase import (BatchResult, FacebookUserMessageSet, MessageSet,
+                      MessageStatus)
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.text = body
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class RecordingMessageSet(MessageSet):
+    """MessageSet that answers sends with queued fake responses."""
+
+    def __init__(self, responses, **kwargs):
+        super(RecordingMessageSet, self).__init__(**kwargs)
+        self.responses = responses
+        self.sent = []
+
+    def send(self, transport=None):
+        self.sent.append([m.message for m in self.messages])
+        return self.responses.pop(0)
+
+
+def batch_body(*statuses):
+    return json.dumps({'responses': [
+        {'status': s, 'message_id': i} if s == MessageStatus.SUCCESS
+        else {'status': s, 'error': 'bad message'}
+        for i, s in enumerate(statuses)]})
+
+
+class TestBatchResult(unittest.TestCase):
+    def test_parse_per_message_statuses(self):
+        s = FacebookUserMessageSet()
+        msgs = [s.new_message(message='a'), s.new_message(message='b')]
+        result = BatchResult.from_response(
+            FakeResponse(400, batch_body('success', 'error')), msgs)
+        self.assertFalse(result.all_succeeded)
+        self.assertEqual(result.results[0].message_id, 0)
+        self.assertTrue(result.results[0].succeeded)
+        self.assertEqual(result.failed_messages(), [msgs[1]])
+        self.assertEqual(result.failed[0].error, 'bad message')
+
+    def test_parse_without_responses_list(self):
+        s = MessageSet()
+        msgs = [s.new_message(), s.new_message()]
+        ok = BatchResult.from_response(FakeResponse(200, '{}'), msgs)
+        self.assertTrue(ok.all_succeeded)
+        bad = BatchResult.from_response(FakeResponse(500, 'oops'), msgs)
+        self.assertEqual(bad.failed_messages(), msgs)
+        self.assertEqual(bad.results[0].error, 'oops')
+
+    def test_retry_only_failed_subset(self):
+        s = RecordingMessageSet([
+            FakeResponse(400, batch_body('success', 'error', 'error')),
+            FakeResponse(200, batch_body('success', 'success'))],
+            api_key='1234')
+        for text in ('a', 'b', 'c'):
+            s.new_message(message=text)
+        result = s.send_with_results()
+        retry = s.retry_failed(result)
+        self.assertTrue(retry.all_succeeded)
+        self.assertEqual(s.sent, [['a', 'b', 'c'], ['b', 'c']])
+        self.assertEqual([m.message for m in s.messages], ['a', 'b', 'c'])
+        self.assertIsNone(s.retry_failed(retry))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import shutil
+import tempfile
+import threading
+import unittest
+from chatbase import (BatchSender, InMemoryTransport, MessageSet,
+                      SpillingMessageSet, TransportResponse, load_spilled)
+
+
+class FakeResponse(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeSet(object):
+    """Picklable stand-in for a message set with a controllable send."""
+    sent = []
+    gate = threading.Event()
+
+    def __init__(self, name, status_code=200, block=False):
+        self.name = name
+        self.status_code = status_code
+        self.block = block
+
+    def send(self, transport=None):
+        if self.block:
+            FakeSet.gate.wait(5)
+        FakeSet.sent.append(self.name)
+        return FakeResponse(self.status_code)
+
+
+class TestBatchSender(unittest.TestCase):
+    def setUp(self):
+        self.spill_dir = tempfile.mkdtemp()
+        FakeSet.sent = []
+        FakeSet.gate.clear()
+
+    def tearDown(self):
+        FakeSet.gate.set()
+        shutil.rmtree(self.spill_dir)
+
+    def test_flush_sends_everything(self):
+        sender = BatchSender(workers=3, spill_dir=self.spill_dir,
+                             register_atexit=False)
+        for i in range(10):
+            sender.send(FakeSet(i))
+        self.assertTrue(sender.close(timeout=5))
+        self.assertEqual(sorted(FakeSet.sent), list(range(10)))
+        self.assertEqual(load_spilled(self.spill_dir), [])
+
+    def test_deadline_spills_unsent(self):
+        sender = BatchSender(workers=1, spill_dir=self.spill_dir,
+                             register_atexit=False)
+        sender.send(FakeSet('blocked', block=True))
+        sender.send(FakeSet('queued'))
+        self.assertFalse(sender.flush(timeout=0.1))
+        self.assertEqual(sender.pending_count(), 0)
+        spilled = load_spilled(self.spill_dir)
+        self.assertEqual(sorted(s.name for s in spilled),
+                         ['blocked', 'queued'])
+        self.assertEqual(load_spilled(self.spill_dir), [])
+        FakeSet.gate.set()
+        sender.close(timeout=1)
+
+    def test_failed_sends_are_spilled(self):
+        sender = BatchSender(workers=2, spill_dir=self.spill_dir,
+                             register_atexit=False)
+        sender.send(FakeSet('ok'))
+        sender.send(FakeSet('bad', status_code=500))
+        self.assertFalse(sender.close(timeout=5))
+        self.assertEqual([s.name for s in load_spilled(self.spill_dir)],
+                         ['bad'])
+
+    def test_failed_spilling_set_batches_are_failures(self):
+        transport = InMemoryTransport(
+            responder=lambda r: TransportResponse(500))
+        sender = BatchSender(workers=1, transport=transport,
+                             register_atexit=False)
+        message_set = SpillingMessageSet(api_key='1234', max_in_memory=1,
+                                         batch_size=1)
+        for i in range(3):
+            message_set.new_message(message='msg-%d' % i)
+        sender.send(message_set)
+        self.assertFalse(sender.close(timeout=5))
+        self.assertEqual(len(transport.requests), 3)
+
+    def test_flush_while_spilling_set_in_flight(self):
+        started = threading.Event()
+
+        def respond(request):
+            started.set()
+            FakeSet.gate.wait(5)
+            return TransportResponse()
+        transport = InMemoryTransport(responder=respond)
+        sender = BatchSender(workers=1, spill_dir=self.spill_dir,
+                             transport=transport, register_atexit=False)
+        message_set = SpillingMessageSet(api_key='1234', max_in_memory=1,
+                                         batch_size=1)
+        for i in range(200):
+            message_set.new_message(message='msg-%d' % i)
+        sender.send(message_set)
+        self.assertTrue(started.wait(5))
+        self.assertFalse(sender.flush(timeout=0.05))
+        FakeSet.gate.set()
+        sender.close(timeout=5)
+        for thread in sender._threads:
+            thread.join(5)
+        self.assertEqual([r.json()['messages'][0]['message']
+                          for r in transport.requests],
+                         ['msg-%d' % i for i in range(200)])
+        restored = load_spilled(self.spill_dir)[0]
+        self.assertEqual(restored.to_json(), message_set.to_json())
+
+    def test_response_without_status_is_a_failure(self):
+        sender = BatchSender(workers=1, register_atexit=False)
+        sender.send(FakeSet('none', status_code=None))
+        self.assertFalse(sender.close(timeout=5))
+
+    def test_message_set_round_trips_through_spill(self):
+        sender = BatchSender(workers=1, spill_dir=self.spill_dir,
+                             register_atexit=False)
+        sender.close(timeout=1)
+        message_set = MessageSet(api_key='1234', platform='1', user_id='5')
+        message_set.new_message(intent='3', message='2')
+        sender._spill([message_set])
+        restored = load_spilled(self.spill_dir)[0]
+        self.assertEqual(restored.to_json(), message_set.to_json())
+
+    def test_spilling_set_round_trips_through_spill(self):
+        sender = BatchSender(workers=1, spill_dir=self.spill_dir,
+                             register_atexit=False)
+        sender.close(timeout=1)
+        message_set = SpillingMessageSet(api_key='1234', max_in_memory=1)
+        for i in range(3):
+            message_set.new_message(message='msg-%d' % i)
+        sender._spill([message_set])
+        restored = load_spilled(self.spill_dir)[0]
+        self.assertEqual(restored.to_json(), message_set.to_json())
+
+    def test_send_after_close_raises(self):
+        sender = BatchSender(workers=1, register_atexit=False)
+        sender.close(timeout=1)
+        with self.assertRaises(RuntimeError):
+            sender.send(FakeSet('late'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from chatbase import *
+from chatbase.replay import pooled_transport, replay, rewrite_url
+
+
+class TestCaptureReplay(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'traffic.cbcap')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def capture(self):
+        forwarded = InMemoryTransport()
+        t = CaptureTransport(self.path, transport=forwarded)
+        fb_set = FacebookUserMessageSet(api_key='k')
+        fb_set.new_message(message=u'café')
+        items = [Message(api_key='k', message='a'), fb_set,
+                 FacebookAgentMessage(api_key='k')]
+        for item in items:
+            item.send(transport=t)
+        t.close()
+        return items, forwarded
+
+    def test_capture_records_exact_payloads(self):
+        items, forwarded = self.capture()
+        captured = list(read_capture(self.path))
+        self.assertEqual(len(forwarded.requests), 3)
+        self.assertEqual([c.url for c in captured],
+                         [i.get_url() for i in items])
+        self.assertEqual([c.data.decode('utf-8') for c in captured],
+                         [r.data for r in forwarded.requests])
+        offsets = [c.offset for c in captured]
+        self.assertEqual(offsets, sorted(offsets))
+
+    def test_capture_as_default_transport(self):
+        previous = get_default_transport()
+        forwarded = InMemoryTransport()
+        set_default_transport(forwarded)
+        try:
+            capture = CaptureTransport(self.path)
+            set_default_transport(capture)
+            resp = Message(api_key='k').send()
+            capture.close()
+        finally:
+            set_default_transport(previous)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(forwarded.requests), 1)
+        self.assertEqual(len(list(read_capture(self.path))), 1)
+        with self.assertRaises(ValueError):
+            capture.transport = capture
+
+    def test_rejects_other_files(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a capture')
+        with self.assertRaises(Exception):
+            list(read_capture(self.path))
+
+    def test_rewrite_url(self):
+        url = 'https://chatbase.com/api/messages?api_key=k'
+        self.assertEqual(rewrite_url(url, 'http://localhost:8080/stub/'),
+                         'http://localhost:8080/stub/api/messages?api_key=k')
+        self.assertEqual(rewrite_url(url, None), url)
+
+    def test_replace_api_key(self):
+        url, data = replace_api_key(
+            'https://chatbase.com/api/messages?api_key=k&x=1',
+            b'{"api_key": "k\\"1", "message": "\\"api_key\\": \\"k\\""}',
+            'a&b')
+        self.assertEqual(url, 'https://chatbase.com/api/messages'
+                         '?api_key=a%26b&x=1')
+        self.assertEqual(json.loads(data.decode('utf-8')),
+                         {'api_key': 'a&b', 'message': '"api_key": "k"'})
+
+    def test_capture_replaces_api_key(self):
+        forwarded = InMemoryTransport()
+        t = CaptureTransport(self.path, transport=forwarded, api_key='')
+        Message(api_key='secret', message='a').send(transport=t)
+        s = MessageSet(api_key='secret', platform='p', user_id='u')
+        s.new_message(message='b')
+        s.send(transport=t)
+        t.close()
+        for captured in read_capture(self.path):
+            self.assertFalse('secret' in captured.url)
+            self.assertFalse(b'secret' in captured.data)
+        # forwarded requests keep their key
+        self.assertTrue(all('secret' in r.url + r.data
+                            for r in forwarded.requests))
+
+    def test_replay_replaces_api_key(self):
+        self.capture()
+        target = InMemoryTransport()
+        replay(self.path, speed=None, transport=target, api_key='test')
+        self.assertEqual(len(target.requests), 3)
+        # single Messages carry the key in their body only
+        for request in target.requests[1:]:
+            self.assertTrue(request.url.endswith('?api_key=test'))
+        self.assertEqual(json.loads(target.requests[0].data.decode('utf-8'))
+                         ['api_key'], 'test')
+
+    def test_replay_reports(self):
+        self.capture()
+        target = InMemoryTransport(
+            responder=lambda r: TransportResponse(
+                500 if '/message_received?' in r.url else 200))
+        report = replay(self.path, endpoint='http://localhost:8080',
+                        speed=50, concurrency=2, transport=target)
+        self.assertEqual(report.sent, 3)
+        self.assertEqual(report.errors, 1)
+        self.assertTrue(all(r.url.startswith('http://localhost:8080/api/')
+                            for r in target.requests))
+        self.assertTrue(report.percentile(99) >= report.percentile(50))
+        self.assertTrue(report.throughput > 0)
+
+    def test_replay_latency_includes_queueing(self):
+        self.capture()
+
+        def slow(request):
+            time.sleep(0.05)
+            return TransportResponse()
+        report = replay(self.path, speed=None, concurrency=1,
+                        transport=InMemoryTransport(responder=slow))
+        # The last request waited for the two before it on the one worker
+        self.assertTrue(report.latencies[-1] >= 0.1)
+
+    def test_pooled_transport(self):
+        transport = pooled_transport(32, timeout=3)
+        adapter = transport.session.get_adapter('http://localhost:8080/')
+        self.assertEqual(adapter._pool_maxsize, 32)
+        self.assertEqual(transport.timeout, 3)
+        transport.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import threading
+import time
+import unittest
+from chatbase import *
+
+
+class TestOrderedDispatcher(unittest.TestCase):
+    def test_order_kept_per_user(self):
+        in_flight = {}
+        lock = threading.Lock()
+        overlaps = []
+
+        def respond(request):
+            user = request.json()['user_id']
+            with lock:
+                if in_flight.get(user):
+                    overlaps.append(user)
+                in_flight[user] = True
+            time.sleep(random.random() * 0.002)
+            with lock:
+                in_flight[user] = False
+            return TransportResponse()
+
+        t = InMemoryTransport(responder=respond)
+        d = OrderedDispatcher(workers=8, transport=t)
+        for i in range(50):
+            for user in ('a', 'b', 'c', 'd'):
+                d.submit(Message(user_id=user, message=str(i)))
+        self.assertTrue(d.close(timeout=10))
+        self.assertEqual(overlaps, [])
+        for user in ('a', 'b', 'c', 'd'):
+            self.assertEqual([r.json()['message'] for r in t.requests
+                              if r.json()['user_id'] == user],
+                             [str(i) for i in range(50)])
+        self.assertEqual(d.pending_count(), 0)
+
+    def test_users_run_concurrently(self):
+        gate = threading.Event()
+        started = []
+
+        def respond(request):
+            started.append(request.json()['sender']['id'])
+            gate.wait(5)
+            return TransportResponse()
+
+        d = OrderedDispatcher(workers=3,
+                              transport=InMemoryTransport(responder=respond))
+        for user in ('x', 'x', 'y', 'z'):
+            m = FacebookUserMessage()
+            m.set_sender_id(user)
+            d.submit(m)
+        self.assertFalse(d.join(timeout=0.2))
+        self.assertEqual(sorted(started), ['x', 'y', 'z'])
+        gate.set()
+        self.assertTrue(d.close(timeout=5))
+        self.assertEqual(started.count('x'), 2)
+
+    def test_callback_reports_errors(self):
+        def fail(request):
+            raise IOError('boom')
+        outcomes = []
+        d = OrderedDispatcher(workers=1,
+                              transport=InMemoryTransport(responder=fail),
+                              callback=lambda m, r, e: outcomes.append((r, e)))
+        d.submit(Message(user_id='u'))
+        d.close(timeout=5)
+        self.assertIsNone(outcomes[0][0])
+        self.assertTrue(isinstance(outcomes[0][1], IOError))
+        with self.assertRaises(RuntimeError):
+            d.submit(Message(user_id='u'))
+
+    def test_failing_callback_keeps_lane_moving(self):
+        def fail(message_object, response, error):
+            raise ValueError('callback bug')
+        t = InMemoryTransport()
+        d = OrderedDispatcher(workers=1, transport=t, callback=fail)
+        for i in range(3):
+            d.submit(Message(user_id='u', message=str(i)))
+        self.assertTrue(d.join(timeout=5))
+        self.assertEqual([r.json()['message'] for r in t.requests],
+                         ['0', '1', '2'])
+        self.assertTrue(d.close(timeout=5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import multiprocessing
+import threading
+import unittest
+from chatbase import *
+
+
+def build_sets(count):
+    msg_set = MessageSet(api_key='k', platform='p', user_id='u')
+    user_set = FacebookUserMessageSet(api_key='k', version='1')
+    agent_set = FacebookAgentMessageSet(api_key='k', version='1')
+    for i in range(count):
+        msg_set.new_message(intent='i%d' % i, message=u'm\xe9%d' % i)
+        user_msg = user_set.new_message(intent='i%d' % i, message='m%d' % i)
+        user_msg.set_sender_id(str(i))
+        agent_msg = agent_set.new_message(intent='i%d' % i, message='m%d' % i)
+        agent_msg.set_recipient_id(str(i))
+    return msg_set, user_set, agent_set
+
+
+class TestParallelEncoding(unittest.TestCase):
+    def test_matches_to_json(self):
+        for s in build_sets(25):
+            bodies = encode_parallel(s, processes=2, shard_size=4)
+            self.assertEqual(len(bodies), 1)
+            self.assertEqual(bodies[0].decode('utf-8'), s.to_json())
+
+    def test_given_pool(self):
+        s = build_sets(10)[2]
+        pool = multiprocessing.Pool(2)
+        try:
+            bodies = encode_parallel(s, shard_size=3, pool=pool)
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(bodies[0].decode('utf-8'), s.to_json())
+
+    def test_inline_for_small_sets(self):
+        s = build_sets(3)[0]
+        self.assertEqual(encode_parallel(s)[0].decode('utf-8'), s.to_json())
+        self.assertEqual(json.loads(encode_parallel(MessageSet())[0]),
+                         {'messages': []})
+
+    def test_batches(self):
+        s = build_sets(10)[1]
+        t = InMemoryTransport()
+        responses = send_parallel(s, transport=t, processes=2, shard_size=3,
+                                  batch_size=4)
+        self.assertEqual(len(responses), 3)
+        sizes = [len(r.json()['messages']) for r in t.requests]
+        self.assertEqual(sizes, [4, 4, 2])
+        self.assertEqual(t.requests[2].json()['messages'][1]['sender'],
+                         {'id': '9'})
+        self.assertEqual(t.requests[0].url, s.get_url())
+
+    def test_threads_alive(self):
+        gate = threading.Event()
+        thread = threading.Thread(target=gate.wait, args=(10,))
+        thread.start()
+        try:
+            s = build_sets(10)[0]
+            bodies = encode_parallel(s, processes=2, shard_size=4)
+        finally:
+            gate.set()
+            thread.join()
+        self.assertEqual(bodies[0].decode('utf-8'), s.to_json())
+
+    def test_rejects_spilled_messages(self):
+        s = SpillingMessageSet(api_key='k', max_in_memory=2)
+        for i in range(3):
+            s.new_message(message=str(i))
+        self.assertRaises(ValueError, encode_parallel, s)
+        s.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import json
+import pickle
+import unittest
+from chatbase import *
+
+# Pickled by releases before compact pickling, with nested objects in __dict__
+LEGACY_USER_MESSAGE = base64.b64decode(
+    'gAJjY2hhdGJhc2UuZmFjZWJvb2tfdXNlcl9tZXNzYWdlCkZhY2Vib29rVXNlck1l'
+    'c3NhZ2UKcQApgXEBfXECKFgHAAAAYXBpX2tleXEDWAEAAABrcQRYCAAAAHBsYXRm'
+    'b3JtcQVYAAAAAHEGWAcAAABtZXNzYWdlcQdYAgAAAGhpcQhYBgAAAGludGVudHEJ'
+    'WAEAAABpcQpYBwAAAHZlcnNpb25xC1gBAAAAMXEMWAcAAAB1c2VyX2lkcQ1oBlgL'
+    'AAAAbm90X2hhbmRsZWRxDohYCAAAAGZlZWRiYWNrcQ+JWAoAAAB0aW1lX3N0YW1w'
+    'cRCKBgCY9z5dAVgEAAAAdHlwZXERWAQAAAB1c2VycRJYBgAAAHNlbmRlcnETY2No'
+    'YXRiYXNlLmZhY2Vib29rX2NoYXRiYXNlX2ZpZWxkcwpGYWNlYm9va0lECnEUKYFx'
+    'FX1xFlgCAAAAaWRxF2gMc2JYCQAAAHJlY2lwaWVudHEYaBQpgXEZfXEaaBdYAQAA'
+    'ADJxG3NiWAoAAABmYl9tZXNzYWdlcRxjY2hhdGJhc2UuZmFjZWJvb2tfY2hhdGJh'
+    'c2VfZmllbGRzCkZhY2Vib29rVXNlck1lc3NhZ2VDb250ZW50CnEdKYFxHn1xHyhY'
+    'AwAAAG1pZHEgWAEAAAAzcSFYBAAAAHRleHRxImgIdWJYCQAAAHRpbWVzdGFtcHEj'
+    'igYAmPc+XQFYDwAAAGNoYXRiYXNlX2ZpZWxkc3EkY2NoYXRiYXNlLmZhY2Vib29r'
+    'X2NoYXRiYXNlX2ZpZWxkcwpDaGF0YmFzZUZpZWxkcwpxJSmBcSZ9cScoaAloCmgL'
+    'aAxoDohoD4l1YnViLg==')
+LEGACY_AGENT_MESSAGE = base64.b64decode(
+    'gAJjY2hhdGJhc2UuZmFjZWJvb2tfYWdlbnRfbWVzc2FnZQpGYWNlYm9va0FnZW50'
+    'TWVzc2FnZQpxACmBcQF9cQIoWAcAAABhcGlfa2V5cQNYAQAAAGtxBFgIAAAAcGxh'
+    'dGZvcm1xBVgAAAAAcQZYBwAAAG1lc3NhZ2VxB1gCAAAAeW9xCFgGAAAAaW50ZW50'
+    'cQlYAQAAAGlxClgHAAAAdmVyc2lvbnELWAEAAAAxcQxYBwAAAHVzZXJfaWRxDWgG'
+    'WAsAAABub3RfaGFuZGxlZHEOiVgIAAAAZmVlZGJhY2txD4lYCgAAAHRpbWVfc3Rh'
+    'bXBxEIoGAJj3Pl0BWAQAAAB0eXBlcRFYBAAAAHVzZXJxElgMAAAAcmVxdWVzdF9i'
+    'b2R5cRNjY2hhdGJhc2UuZmFjZWJvb2tfYWdlbnRfbWVzc2FnZQpGYWNlYm9va0Fn'
+    'ZW50TWVzc2FnZVJlcXVlc3RCb2R5CnEUKYFxFX1xFihYCQAAAHJlY2lwaWVudHEX'
+    'Y2NoYXRiYXNlLmZhY2Vib29rX2NoYXRiYXNlX2ZpZWxkcwpGYWNlYm9va0lECnEY'
+    'KYFxGX1xGlgCAAAAaWRxG1gBAAAAMnEcc2JoB2NjaGF0YmFzZS5mYWNlYm9va19j'
+    'aGF0YmFzZV9maWVsZHMKRmFjZWJvb2tVc2VyTWVzc2FnZUNvbnRlbnQKcR0pgXEe'
+    'fXEfKFgDAAAAbWlkcSBYAQAAADNxIVgEAAAAdGV4dHEiaAh1YlgJAAAAdGltZXN0'
+    'YW1wcSOKBgCY9z5dAXViWA0AAAByZXNwb25zZV9ib2R5cSRjY2hhdGJhc2UuZmFj'
+    'ZWJvb2tfYWdlbnRfbWVzc2FnZQpGYWNlYm9va0FnZW50TWVzc2FnZVJlc3BvbnNl'
+    'Qm9keQpxJSmBcSZ9cScoWAwAAAByZWNpcGllbnRfaWRxKGgcWAoAAABtZXNzYWdl'
+    'X2lkcSloIXViWA8AAABjaGF0YmFzZV9maWVsZHNxKmNjaGF0YmFzZS5mYWNlYm9v'
+    'a19jaGF0YmFzZV9maWVsZHMKQ2hhdGJhc2VGaWVsZHMKcSspgXEsfXEtKGgJaApo'
+    'C2gMaA6JaA+JdWJ1Yi4=')
+LEGACY_MESSAGE_SET = base64.b64decode(
+    'gAJjY2hhdGJhc2UuYmFzZV9tZXNzYWdlCk1lc3NhZ2VTZXQKcQApgXEBfXECKFgH'
+    'AAAAYXBpX2tleXEDWAEAAABrcQRYCAAAAHBsYXRmb3JtcQVYAQAAAHBxBlgHAAAA'
+    'dmVyc2lvbnEHWAAAAABxCFgHAAAAdXNlcl9pZHEJWAEAAAB1cQpYCAAAAG1lc3Nh'
+    'Z2VzcQtdcQxjY2hhdGJhc2UuYmFzZV9tZXNzYWdlCk1lc3NhZ2UKcQ0pgXEOfXEP'
+    'KGgDaARoBWgGWAcAAABtZXNzYWdlcRBYAQAAAG1xEVgGAAAAaW50ZW50cRJoCGgH'
+    'aAhoCWgKWAsAAABub3RfaGFuZGxlZHEOiVgIAAAAZmVlZGJhY2txFIlYCgAAAHRp'
+    'bWVfc3RhbXBxFYoGAJj3Pl0BWAQAAAB0eXBlcRZYBAAAAHVzZXJxF3ViYXViLg==')
+
+
+def round_trip(obj):
+    return pickle.loads(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+
+
+class TestPickling(unittest.TestCase):
+    def test_message(self):
+        m = Message(api_key='k', platform='p', message='hi', intent='i',
+                    version='1', user_id='u', type=MessageTypes.AGENT)
+        m.set_as_not_feedback()
+        copy = round_trip(m)
+        self.assertEqual(copy.__dict__, m.__dict__)
+        self.assertEqual(copy.to_json(), m.to_json())
+
+    def test_facebook_user_message(self):
+        m = FacebookUserMessage(api_key='k', intent='i', version='1',
+                                message='hi')
+        m.set_sender_id('1')
+        m.set_recipient_id('2')
+        m.set_message_id('3')
+        m.set_as_not_handled()
+        copy = round_trip(m)
+        self.assertEqual(copy.to_json(), m.to_json())
+        self.assertEqual(copy.chatbase_fields.not_handled, True)
+        self.assertEqual(copy.timestamp, m.timestamp)
+        self.assertEqual(copy.get_url(), m.get_url())
+
+    def test_facebook_agent_message(self):
+        m = FacebookAgentMessage(api_key='k', intent='i', version='1',
+                                 message='hi')
+        m.set_recipient_id('2')
+        m.set_message_id('3')
+        copy = round_trip(m)
+        self.assertEqual(copy.to_json(), m.to_json())
+        self.assertEqual(copy.response_body.recipient_id, '2')
+        self.assertTrue(isinstance(copy.request_body,
+                                   FacebookAgentMessageRequestBody))
+
+    def test_sets(self):
+        sampler = Sampler(rate=0.5, salt='s')
+        sets = [MessageSet(api_key='k', platform='p', user_id='u'),
+                FacebookUserMessageSet(api_key='k', sampler=sampler),
+                FacebookAgentMessageSet(api_key='k', version='1')]
+        for s in sets:
+            for i in range(5):
+                s.new_message(intent='i', message=str(i))
+            copy = round_trip(s)
+            self.assertEqual(type(copy), type(s))
+            self.assertEqual(copy.to_json(), s.to_json())
+        self.assertEqual(round_trip(sets[1]).sampler.salt, 's')
+
+    def test_spilling_message_set(self):
+        s = SpillingMessageSet(api_key='k', platform='p', user_id='u',
+                               max_in_memory=2, batch_size=3)
+        for i in range(5):
+            s.new_message(intent='i', message=str(i))
+        s.trace_id = 'abc'
+        copy = round_trip(s)
+        self.assertEqual(copy.to_json(), s.to_json())
+        self.assertEqual(copy.spilled_count, 3)
+        self.assertEqual(list(copy.iter_batches()), list(s.iter_batches()))
+        self.assertEqual(copy.trace_id, 'abc')
+        copy.new_message(message='5')
+        self.assertEqual(copy.spilled_count, 4)
+        self.assertEqual(len(s), 5)
+        s.close()
+        copy.close()
+        empty = round_trip(SpillingMessageSet(api_key='k'))
+        self.assertEqual(len(empty), 0)
+        self.assertEqual(empty.to_json(), '{"messages":[]}')
+
+    def test_assigned_nested_objects_survive(self):
+        m = FacebookUserMessage(api_key='k', message='hi')
+        m.sender = FacebookID()
+        m.sender.id = '1'
+        copy = round_trip(m)
+        self.assertEqual(copy.to_json(), m.to_json())
+        copy.sender.id = '2'
+        self.assertEqual(copy.get_user_key(), '2')
+
+    def test_legacy_pickles_load(self):
+        user = pickle.loads(LEGACY_USER_MESSAGE)
+        self.assertEqual(json.loads(user.to_json()), {
+            'sender': {'id': '1'}, 'recipient': {'id': '2'},
+            'timestamp': 1500000000000,
+            'message': {'mid': '3', 'text': 'hi'},
+            'chatbase_fields': {'intent': 'i', 'version': '1',
+                                'not_handled': True, 'feedback': False}})
+        self.assertEqual(user.get_user_key(), '1')
+        agent = pickle.loads(LEGACY_AGENT_MESSAGE)
+        self.assertEqual(json.loads(agent.to_json()), {
+            'request_body': {'recipient': {'id': '2'},
+                             'message': {'mid': '3', 'text': 'yo'},
+                             'timestamp': 1500000000000},
+            'response_body': {'recipient_id': '2', 'message_id': '3'},
+            'chatbase_fields': {'intent': 'i', 'version': '1',
+                                'not_handled': False, 'feedback': False}})
+        self.assertEqual(round_trip(agent).to_json(), agent.to_json())
+        # a flat __dict__ state, as default pickling produces, loads as is
+        for m in (user, agent):
+            copy = type(m).__new__(type(m))
+            copy.__setstate__(dict(m.__dict__))
+            self.assertEqual(copy.to_json(), m.to_json())
+        message_set = pickle.loads(LEGACY_MESSAGE_SET)
+        self.assertIsNone(message_set.sampler)
+        self.assertEqual(json.loads(message_set.to_json())['messages'][0]
+                         ['message'], 'm')
+
+    def test_set_messages_are_packed(self):
+        s = FacebookUserMessageSet(api_key='k')
+        for i in range(3):
+            s.new_message(message=str(i)).set_sender_id(str(i))
+        packed = s._get_state()[-1]
+        self.assertEqual(packed[0], FacebookUserMessage)
+        self.assertEqual(len(packed[1]), 3)
+        self.assertEqual(round_trip(s).to_json(), s.to_json())
+        # messages with extra attributes, assigned objects or shared
+        # instances are pickled one by one
+        s.messages[0].sender = FacebookID()
+        s.messages[0].sender.id = '9'
+        s.messages[1].trace_id = 'abc'
+        s.messages.append(s.messages[2])
+        self.assertTrue(isinstance(s._get_state()[-1], list))
+        copy = round_trip(s)
+        self.assertEqual(copy.to_json(), s.to_json())
+        self.assertEqual(copy.messages[1].trace_id, 'abc')
+        self.assertTrue(copy.messages[2] is copy.messages[3])
+
+    def test_extra_attributes_survive(self):
+        m = Message(user_id='u')
+        m.trace_id = 'abc'
+        self.assertEqual(round_trip(m).trace_id, 'abc')
+
+    def test_payload_is_smaller(self):
+        m = FacebookUserMessage(api_key='k', intent='i', message='hi')
+        m.set_sender_id('1')
+        compact = pickle.dumps(m, pickle.HIGHEST_PROTOCOL)
+        default = pickle.dumps(m.__dict__, pickle.HIGHEST_PROTOCOL)
+        self.assertTrue(len(compact) < len(default))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+from chatbase import *
+
+
+class TestSampler(unittest.TestCase):
+    def test_stable_and_proportional(self):
+        sampler = Sampler(rate=0.3)
+        users = ['user-%d' % i for i in range(2000)]
+        kept = [u for u in users if sampler.keep(u)]
+        self.assertEqual(kept, [u for u in users if Sampler(0.3).keep(u)])
+        self.assertTrue(500 < len(kept) < 700)
+        self.assertNotEqual(kept,
+                            [u for u in users if Sampler(0.3, salt='x').keep(u)])
+
+    def test_bounds_and_intent_overrides(self):
+        sampler = Sampler(rate=0.1, intent_rates={'buy': 1.0, 'spam': 0})
+        users = ['user-%d' % i for i in range(200)]
+        self.assertTrue(all(sampler.keep(u, 'buy') for u in users))
+        self.assertFalse(any(sampler.keep(u, 'spam') for u in users))
+        # users kept at the base rate are kept at every higher rate
+        higher = Sampler(rate=0.5)
+        self.assertTrue(all(higher.keep(u) for u in users if sampler.keep(u)))
+
+    def test_message_set_skips_sampled_out_users(self):
+        sampler = Sampler(rate=0.5)
+        kept_user = next(u for u in map(str, range(100)) if sampler.keep(u))
+        dropped_user = next(u for u in map(str, range(100))
+                            if not sampler.keep(u))
+        s = MessageSet(api_key='k', platform='p', user_id=dropped_user,
+                       sampler=sampler)
+        self.assertIsNone(s.new_message(message='a'))
+        s.append_message(Message(user_id=dropped_user))
+        s.append_message(Message(user_id=kept_user, message='b'))
+        self.assertEqual(len(s.messages), 1)
+        # ids changed after construction are sampled at send time
+        s.messages[0].user_id = dropped_user
+        self.assertEqual(json.loads(s.to_json()), {'messages': []})
+
+    def test_new_message_hashes_once(self):
+        class CountingSampler(Sampler):
+            calls = 0
+
+            def bucket(self, user_key):
+                CountingSampler.calls += 1
+                return Sampler.bucket(self, user_key)
+        for cls in (MessageSet, SpillingMessageSet):
+            sampler = CountingSampler(0.999)
+            user = next(u for u in map(str, range(100)) if sampler.keep(u))
+            CountingSampler.calls = 0
+            s = cls(api_key='k', user_id=user, sampler=sampler)
+            self.assertIsNotNone(s.new_message(message='a'))
+            self.assertEqual(len(s.messages), 1)
+            self.assertEqual(CountingSampler.calls, 1)
+
+    def test_facebook_sets_sample_at_encode(self):
+        sampler = Sampler(rate=0.5)
+        users = [str(i) for i in range(20)]
+        user_set = FacebookUserMessageSet(sampler=sampler)
+        agent_set = FacebookAgentMessageSet(sampler=sampler)
+        for u in users:
+            user_set.new_message(message=u).set_sender_id(u)
+            agent_set.new_message(message=u).set_recipient_id(u)
+        expected = [u for u in users if sampler.keep(u)]
+        self.assertEqual([m['message']['text'] for m in
+                          json.loads(user_set.to_json())['messages']],
+                         expected)
+        self.assertEqual([m['message'] for m in
+                          json.loads(agent_set.to_json())['messages']],
+                         expected)
+        t = InMemoryTransport()
+        result = agent_set.send_with_results(transport=t)
+        self.assertEqual([r.message.message for r in result.results],
+                         expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
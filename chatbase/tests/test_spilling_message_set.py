@@ -0,0 +1,125 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+from chatbase import (InMemoryTransport, Message, MessageSet,
+                      SpillingMessageSet, TransportResponse, send_adaptive)
+
+
+class TestSpillingMessageSet(unittest.TestCase):
+    def build(self, count, **kwargs):
+        s = SpillingMessageSet(api_key='1234', platform='1', version='4',
+                               user_id='5', **kwargs)
+        for i in range(count):
+            s.new_message(intent='int-%d' % i, message='msg-%d' % i,
+                          time_stamp=1000 + i)
+        return s
+
+    def test_spills_beyond_limit(self):
+        s = self.build(10, max_in_memory=3)
+        self.assertEqual(len(s.messages), 3)
+        self.assertEqual(s.spilled_count, 7)
+        self.assertEqual(len(s), 10)
+        self.assertEqual(s.messages[0].message, 'msg-7')
+        s.close()
+
+    def test_to_json_matches_message_set(self):
+        s = self.build(10, max_in_memory=3)
+        plain = MessageSet(api_key='1234')
+        for i in range(10):
+            plain.append_message(Message(api_key='1234', platform='1',
+                                         version='4', user_id='5',
+                                         intent='int-%d' % i,
+                                         message='msg-%d' % i,
+                                         time_stamp=1000 + i))
+        self.assertEqual(json.loads(s.to_json()), json.loads(plain.to_json()))
+        # reading back must not disturb later appends
+        s.new_message(message='msg-10')
+        self.assertEqual(len(json.loads(s.to_json())['messages']), 11)
+        s.close()
+
+    def test_send_streams_batches(self):
+        t = InMemoryTransport()
+        with self.build(7, max_in_memory=2, batch_size=3) as s:
+            response = s.send(transport=t)
+        self.assertEqual(len(response.responses), 3)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([len(r.json()['messages']) for r in t.requests],
+                         [3, 3, 1])
+        self.assertEqual(t.requests[2].json()['messages'][0]['message'],
+                         'msg-6')
+        self.assertEqual(t.requests[0].url,
+                         'https://chatbase.com/api/messages?api_key=1234')
+
+    def test_send_reports_worst_batch(self):
+        t = InMemoryTransport(responder=lambda r: TransportResponse(
+            500 if 'msg-4' in r.data else 200, '{"status": "boom"}'))
+        with self.build(7, max_in_memory=2, batch_size=3) as s:
+            response = s.send(transport=t)
+        self.assertEqual([r.status_code for r in response.responses],
+                         [200, 500, 200])
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json(), {'status': 'boom'})
+
+    def test_send_with_results_and_retry(self):
+        def responder(request):
+            entries = [{'status': 'error' if m['message'] == 'msg-5'
+                        else 'success'}
+                       for m in request.json()['messages']]
+            return TransportResponse(200, json.dumps({'responses': entries}))
+        t = InMemoryTransport(responder=responder)
+        with self.build(7, max_in_memory=3, batch_size=3) as s:
+            result = s.send_with_results(transport=t)
+            self.assertEqual([r.message and r.message.message
+                              for r in result.results],
+                             [None] * 4 + ['msg-4', 'msg-5', 'msg-6'])
+            self.assertEqual(result.failed_messages(), [s.messages[1]])
+            self.assertEqual(len(result.response.responses), 3)
+            retry = s.retry_failed(result, transport=t)
+        self.assertEqual(t.requests[-1].json()['messages'][0]['message'],
+                         'msg-5')
+        self.assertEqual(len(t.requests[-1].json()['messages']), 1)
+        self.assertEqual(len(retry.results), 1)
+
+    def test_failed_spilled_batch_is_reported(self):
+        t = InMemoryTransport(responder=lambda r: TransportResponse(
+            500 if len(t.requests) == 1 else 200))
+        with self.build(4, max_in_memory=2, batch_size=2) as s:
+            result = s.send_with_results(transport=t)
+            self.assertEqual(result.response.status_code, 500)
+            self.assertFalse(result.all_succeeded)
+            self.assertEqual(len(result.failed), 2)
+            self.assertEqual(result.failed_messages(), [])
+            self.assertIsNone(s.retry_failed(result, transport=t))
+
+    def test_in_memory_storage_is_a_deque(self):
+        with self.build(5, max_in_memory=2) as s:
+            s.drop_invalid()
+            s.new_message(message='msg-5')
+            self.assertEqual([m.message for m in s.messages],
+                             ['msg-4', 'msg-5'])
+            self.assertEqual(s.spilled_count, 4)
+
+    def test_send_adaptive_rejects_spilled(self):
+        with self.build(5, max_in_memory=2) as s:
+            self.assertRaises(ValueError, send_adaptive, s,
+                              transport=InMemoryTransport())
+        with self.build(2, max_in_memory=2) as s:
+            results = send_adaptive(s, transport=InMemoryTransport())
+        self.assertEqual(sum(len(r.results) for r in results), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from chatbase import *
+from chatbase import transport as transport_module
+
+
+class TestTransport(unittest.TestCase):
+    def test_all_endpoints_use_transport(self):
+        t = InMemoryTransport()
+        msg_set = MessageSet(api_key='k')
+        msg_set.new_message(message='a')
+        fb_user_set = FacebookUserMessageSet(api_key='k')
+        fb_user_set.new_message(message='b')
+        fb_agent_set = FacebookAgentMessageSet(api_key='k')
+        fb_agent_set.new_message(message='c')
+        items = [Message(api_key='k'), msg_set,
+                 FacebookUserMessage(api_key='k'), fb_user_set,
+                 FacebookAgentMessage(api_key='k'), fb_agent_set]
+        for item in items:
+            self.assertEqual(item.send(transport=t).status_code, 200)
+        self.assertEqual([r.url for r in t.requests],
+                         [item.get_url() for item in items])
+        self.assertEqual([r.data for r in t.requests],
+                         [item.to_json() for item in items])
+        self.assertEqual(t.requests[0].headers, Message.get_content_type())
+        self.assertEqual(t.requests[1].url,
+                         'https://chatbase.com/api/messages?api_key=k')
+
+    def test_default_transport(self):
+        previous = get_default_transport()
+        t = InMemoryTransport(
+            responder=lambda r: TransportResponse(400, r.data))
+        set_default_transport(t)
+        try:
+            resp = Message(message='hi').send()
+        finally:
+            set_default_transport(previous)
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json()['message'], 'hi')
+        self.assertEqual(len(t.requests), 1)
+        self.assertTrue(isinstance(previous, RequestsTransport))
+
+    def test_http2_transport_requires_httpx(self):
+        if transport_module.httpx is not None:
+            return
+        with self.assertRaises(ImportError):
+            HTTP2Transport()
+
+
+if __name__ == '__main__':
+    unittest.main()
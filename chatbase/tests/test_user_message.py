@@ -54,6 +54,51 @@ class TestUserMessage(unittest.TestCase):
         i.set_message_id(msg_id)
         self.assertEqual(i.fb_message.mid, msg_id)
 
+    def test_nested_views(self):
+        i = FacebookUserMessage(message='hello')
+        i.sender.id = 'snd'
+        i.fb_message.mid = 'mid'
+        self.assertEqual(i.get_user_key(), 'snd')
+        self.assertEqual(i.fb_message.text, 'hello')
+        self.assertTrue(isinstance(i.recipient, FacebookID))
+        self.assertTrue(isinstance(i.chatbase_fields, ChatbaseFields))
+        rec = FacebookID()
+        rec.id = 'rec'
+        i.recipient = rec
+        self.assertEqual(json.loads(i.to_json())['recipient'], {'id': 'rec'})
+        self.assertEqual(json.loads(json.dumps(i.fb_message,
+                                               default=lambda o: o.__dict__)),
+                         {'mid': 'mid', 'text': 'hello'})
+        self.assertEqual(i.timestamp, i.time_stamp)
+
+    def test_assigning_views(self):
+        i = FacebookUserMessage(intent='int', message='keep')
+        content = FacebookUserMessageContent()
+        content.mid = 'mid'
+        i.fb_message = content
+        fields = ChatbaseFields()
+        fields.intent = 'assigned'
+        i.chatbase_fields = fields
+        self.assertEqual(i.chatbase_fields.intent, 'assigned')
+        encoded = json.loads(i.to_json())
+        self.assertEqual(encoded['message'], {'mid': 'mid', 'text': 'keep'})
+        self.assertEqual(encoded['chatbase_fields']['intent'], 'int')
+        self.assertEqual(i.message, 'keep')
+
+    def test_assigned_objects_stay_live(self):
+        i = FacebookUserMessage(message='hello')
+        sender = FacebookID()
+        i.sender = sender
+        sender.id = '123'
+        self.assertIs(i.sender, sender)
+        self.assertEqual(i.sender.id, '123')
+        self.assertEqual(i.get_user_key(), '123')
+        i.set_recipient_id('456')
+        self.assertEqual(json.loads(i.to_json())['sender'], {'id': '123'})
+        self.assertEqual(json.loads(i.to_json())['recipient'], {'id': '456'})
+        self.assertEqual([e.field for e in validate_messages([i])[1]],
+                         ['fb_message.mid'])
+
     def test_to_json(self):
         api_key = '123-abc'
         intent = '1'
@@ -0,0 +1,99 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from chatbase import *
+
+
+class TestValidation(unittest.TestCase):
+    def test_message_set_rules(self):
+        s = MessageSet(api_key='1234', platform='1', user_id='5')
+        good = s.new_message(message='ok')
+        s.new_message(message='agent', type=MessageTypes.AGENT)
+        no_user = s.new_message(message='no user')
+        no_user.user_id = ''
+        bad_agent = Message(platform='', user_id='5', type=MessageTypes.AGENT,
+                            not_handled=True)
+        s.append_message(bad_agent)
+        errors = s.validate()
+        self.assertEqual([(e.index, e.field) for e in errors],
+                         [(2, 'user_id'), (3, 'platform'), (3, 'not_handled')])
+        self.assertIs(errors[0].message, no_user)
+        self.assertEqual(len(s.messages), 4)
+        self.assertEqual(len(s.drop_invalid()), 3)
+        self.assertEqual([m.message for m in s.messages], ['ok', 'agent'])
+        self.assertIs(s.messages[0], good)
+
+    def test_facebook_user_rules(self):
+        s = FacebookUserMessageSet(api_key='1234')
+        m = s.new_message(message='a')
+        m.set_sender_id('1')
+        m.set_recipient_id('2')
+        m.set_message_id('3')
+        s.new_message(message='b').set_sender_id('1')
+        self.assertEqual([e.field for e in s.drop_invalid()],
+                         ['recipient.id', 'fb_message.mid'])
+        self.assertEqual(s.messages, [m])
+
+    def test_facebook_agent_rules(self):
+        s = FacebookAgentMessageSet(api_key='1234')
+        m = s.new_message(message='a')
+        m.set_recipient_id('2')
+        m.set_message_id('3')
+        s.new_message(message='b').set_message_id('3')
+        errors = s.validate()
+        self.assertEqual([(e.index, e.field) for e in errors],
+                         [(1, 'request_body.recipient.id')])
+        self.assertEqual(errors[0].reason, 'must not be empty')
+
+    def test_validate_on_send(self):
+        t = InMemoryTransport()
+        s = FacebookUserMessageSet(api_key='1234', validate_on_send=True)
+        m = s.new_message(message='a')
+        m.set_sender_id('1')
+        m.set_recipient_id('2')
+        m.set_message_id('3')
+        s.new_message(message='b').set_sender_id('1')
+        result = s.send_with_results(transport=t)
+        self.assertEqual([r.message for r in result.results], [m])
+        self.assertEqual(len(t.requests[0].json()['messages']), 1)
+        self.assertEqual([(e.index, e.field) for e in s.validation_errors],
+                         [(1, 'recipient.id'), (1, 'fb_message.mid')])
+        self.assertEqual(len(s.messages), 2)
+
+    def test_spilling_set_validates_on_send(self):
+        t = InMemoryTransport()
+        s = SpillingMessageSet(api_key='1234', platform='1', user_id='5',
+                               max_in_memory=2, validate_on_send=True)
+        for i in range(5):
+            m = s.new_message(message=str(i))
+            if i in (1, 4):
+                m.user_id = ''
+        self.assertEqual((s.spilled_count, s.dropped_count), (2, 1))
+        s.send(transport=t)
+        sent = t.requests[0].json()['messages']
+        self.assertEqual([m['message'] for m in sent], ['0', '2', '3'])
+        self.assertEqual([(e.index, e.field) for e in s.validation_errors],
+                         [(1, 'user_id'), (4, 'user_id')])
+        s.close()
+
+    def test_validate_messages(self):
+        valid, errors = validate_messages([Message(platform='p', user_id='u'),
+                                           object()])
+        self.assertEqual(len(valid), 2)
+        self.assertEqual(errors, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Define the HTTP transports used to send messages to the Chatbase API."""
+
+import json
+import threading
+import requests
+
+try:
+    import httpx
+except ImportError:  # HTTP/2 support is optional
+    httpx = None
+
+
+class Transport(object):
+    """Base Transport.
+    Every send() posts its encoded payload through a Transport. Responses
+    must expose status_code, text and json() like a requests.Response.
+    """
+
+    def post(self, url, data, headers):
+        """Post data to url and return the response."""
+        raise NotImplementedError
+
+    def close(self):
+        """Release any connections held by the transport."""
+        pass
+
+
+class RequestsTransport(Transport):
+    """Transport backed by a requests Session, reusing connections."""
+
+    def __init__(self, session=None, timeout=None):
+        self.session = session or requests.Session()
+        self.timeout = timeout
+
+    def post(self, url, data, headers):
+        """Post data to url and return the response."""
+        return self.session.post(url, data=data, headers=headers,
+                                 timeout=self.timeout)
+
+    def close(self):
+        """Close the underlying session."""
+        self.session.close()
+
+
+class HTTP2Transport(Transport):
+    """Transport backed by an HTTP/2 capable httpx Client.
+    Concurrent posts from several threads share, and are multiplexed over,
+    a single connection per host. Requires `pip install httpx[http2]`.
+    """
+
+    def __init__(self, client=None, timeout=None):
+        if client is None:
+            if httpx is None:
+                raise ImportError(
+                    'HTTP2Transport requires httpx: pip install httpx[http2]')
+            client = httpx.Client(http2=True, timeout=timeout)
+        self.client = client
+
+    def post(self, url, data, headers):
+        """Post data to url and return the response."""
+        return self.client.post(url, content=data, headers=headers)
+
+    def close(self):
+        """Close the underlying client."""
+        self.client.close()
+
+
+class TransportRequest(object):
+    """A request recorded by the InMemoryTransport."""
+
+    def __init__(self, url, data, headers):
+        self.url = url
+        self.data = data
+        self.headers = headers
+
+    def json(self):
+        """Return the decoded request payload."""
+        return json.loads(self.data)
+
+
+class TransportResponse(object):
+    """A minimal response returned by the InMemoryTransport."""
+
+    def __init__(self, status_code=200, text='{"status": 200}'):
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        """Return the decoded response body."""
+        return json.loads(self.text)
+
+
+class InMemoryTransport(Transport):
+    """Transport that records requests instead of sending them.
+    responder is an optional callable receiving the TransportRequest and
+    returning the response; by default every post gets a 200.
+    """
+
+    def __init__(self, responder=None):
+        self.responder = responder
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def post(self, url, data, headers):
+        """Record the request and return the responder's response."""
+        request = TransportRequest(url, data, headers)
+        with self._lock:
+            self.requests.append(request)
+        if self.responder is None:
+            return TransportResponse()
+        return self.responder(request)
+
+
+_default_transport = None
+
+
+def get_default_transport():
+    """Return the transport used when send() is not given one."""
+    global _default_transport
+    if _default_transport is None:
+        _default_transport = RequestsTransport()
+    return _default_transport
+
+
+def set_default_transport(transport):
+    """Set the transport used when send() is not given one."""
+    global _default_transport
+    _default_transport = transport
+
+
+def get_transport(transport=None):
+    """Return transport, falling back to the default transport."""
+    if transport is None:
+        return get_default_transport()
+    return transport
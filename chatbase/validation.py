@@ -0,0 +1,93 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Validate messages locally before they are encoded and sent.
+
+Each message class lists its checks in a validation_rules class attribute.
+The rules are built once, when the class is defined, so validating a set is
+a tight loop over precompiled attribute getters.
+"""
+
+import operator
+
+
+class Rule(object):
+    """A single check on a message.
+    check receives the message and returns True when it is valid.
+    """
+
+    def __init__(self, field, check, reason):
+        self.field = field
+        self.check = check
+        self.reason = reason
+
+
+class FieldError(object):
+    """A rule violated by the message at index in the validated list."""
+
+    def __init__(self, index, message, field, reason):
+        self.index = index
+        self.message = message
+        self.field = field
+        self.reason = reason
+
+    def __repr__(self):
+        return 'FieldError(%d, %r, %r)' % (self.index, self.field, self.reason)
+
+
+def required(path, attr=None):
+    """Return a Rule requiring the (dotted) attribute path to be non-empty.
+    attr, when given, is the attribute actually read, for fields which are
+    stored flat and exposed at path through a view; path is still followed
+    on messages that were assigned nested objects (see assign_object).
+    """
+    get_path = operator.attrgetter(path)
+    if attr is None:
+        return Rule(path, lambda msg: bool(get_path(msg)), 'must not be empty')
+    get_attr = operator.attrgetter(attr)
+
+    def check(msg):
+        if '_assigned' in msg.__dict__:
+            return bool(get_path(msg))
+        return bool(get_attr(msg))
+    return Rule(path, check, 'must not be empty')
+
+
+def validate_messages(messages):
+    """Run the validation_rules of each message.
+    Returns a (valid messages, FieldErrors) tuple.
+    """
+    valid = []
+    errors = []
+    for index, msg in enumerate(messages):
+        ok = True
+        for rule in getattr(msg, 'validation_rules', ()):
+            try:
+                passed = rule.check(msg)
+            except AttributeError:
+                passed = False
+            if not passed:
+                errors.append(FieldError(index, msg, rule.field, rule.reason))
+                ok = False
+        if ok:
+            valid.append(msg)
+    return valid, errors
+
+
+def drop_invalid(message_set):
+    """Remove the invalid messages from message_set.
+    Returns the FieldErrors, indexed against the messages before removal.
+    """
+    message_set.messages, errors = validate_messages(message_set.messages)
+    return errors
@@ -24,4 +24,5 @@ setup(name='chatbase',
       license='Apache-2.0',
       packages=['chatbase'],
       install_requires=['requests'],
+      extras_require={'http2': ['httpx[http2]']},
       zip_safe=False)